@@ -0,0 +1,95 @@
+# assign_richmenu.py
+# 依受眾分群批次綁定 / 解除個人 rich menu：每次 500 人、併發送出、journal 紀錄進度可續跑
+import os, sys, time, argparse
+import line_api
+from line_api import must_ok, dispatch, state_path, Journal
+from daily_push import iter_followers, resume_chunks
+
+def resolve_menu(token, menu):
+    """richMenuId 直接用；否則當作 alias 查出對應的 richMenuId"""
+    if menu.startswith("richmenu-"):
+        return menu
+    r = line_api.get(token, f"/richmenu/alias/{menu}")
+    must_ok(r, f"get alias {menu}")
+    return r.json()["richMenuId"]
+
+# bulk link/unlink 重送結果相同（冪等），重試交給 dispatcher：max_retries=0
+def post_bulk_link(token, richmenu_id, user_ids):
+    body = {"richMenuId": richmenu_id, "userIds": user_ids}
+    return line_api.post(token, "/richmenu/bulk/link", json_body=body, max_retries=0)
+
+def post_bulk_unlink(token, user_ids):
+    return line_api.post(token, "/richmenu/bulk/unlink", json_body={"userIds": user_ids}, max_retries=0)
+
+def get_user_menu(token, user_id):
+    r = line_api.get(token, f"/user/{user_id}/richmenu")
+    return r.json().get("richMenuId") if r.status_code == 200 else None
+
+def read_ids(path):
+    """一行一個 userId（允許逗號分隔、空行、# 註解）"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0]
+            for uid in line.split(","):
+                if uid.strip():
+                    yield uid.strip()
+
+def verify(token, richmenu_id, sample, timeout=120, interval=5):
+    """bulk link 是非同步處理：抽樣使用者輪詢目前綁定的選單，直到全部生效或逾時"""
+    pending, start = list(sample), time.monotonic()
+    while pending and time.monotonic() - start < timeout:
+        pending = [uid for uid in pending if get_user_menu(token, uid) != richmenu_id]
+        print(f"[Progress] 抽樣 {len(sample)} 人，已生效 {len(sample) - len(pending)}")
+        if pending:
+            time.sleep(interval)
+    return not pending
+
+def main():
+    ap = argparse.ArgumentParser()
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--ids", help="userId 清單檔（一行一個）")
+    src.add_argument("--followers", action="store_true", help="對所有好友（串流 followers/ids）")
+    ap.add_argument("--menu", help="要綁定的 richMenuId 或 alias（例如 menu-member）")
+    ap.add_argument("--unlink", action="store_true", help="解除個人選單（回到全體預設）")
+    ap.add_argument("--journal", default=None, help="進度檔（預設放在 STATE_DIR，依選單/模式命名）")
+    ap.add_argument("--resume", action="store_true", help="跳過 journal 中已成功的人（以 userId 判斷），未完成的批次補送")
+    ap.add_argument("--verify", type=int, default=20, help="完成後抽樣檢查的人數（0=不檢查）")
+    args = ap.parse_args()
+
+    token = os.getenv("LINE_TOKEN")
+    if not token:
+        print("請以環境變數 LINE_TOKEN 提供 Channel access token")
+        sys.exit(1)
+    if not args.unlink and not args.menu:
+        ap.error("需指定 --menu（或改用 --unlink）")
+
+    rid = None if args.unlink else resolve_menu(token, args.menu)
+    what = "bulk unlink" if args.unlink else f"bulk link {args.menu}"
+    journal = Journal(args.journal or state_path(f"assign_{'unlink' if args.unlink else args.menu}.jsonl", token))
+    if args.resume:
+        journal.load()
+    else:
+        journal.reset()
+
+    ids = iter_followers(token) if args.followers else read_ids(args.ids)
+    sample = []
+    def chunks():
+        for chunk in resume_chunks(ids, journal, 500):   # bulk API 一次最多 500 人；續跑以 userId 略過已完成的
+            if len(sample) < args.verify:
+                sample.append(chunk[0])
+            yield chunk
+
+    send = (lambda c, key: post_bulk_unlink(token, c)) if args.unlink else \
+           (lambda c, key: post_bulk_link(token, rid, c))
+    failed = dispatch(chunks(), send, what, endpoint="bulk", bucket=line_api.client(token).bucket("bulk"),
+                      on_result=lambda idx, c, ok, info: journal.record(c, ok, info))
+
+    if sample and not failed:
+        if not verify(token, rid, sample):
+            print("[WARN] 抽樣中仍有使用者尚未生效（LINE 端非同步處理中），可稍後再檢查")
+    if failed:
+        print(f"[ERROR] {len(failed)} 批失敗，修正後以 --resume 重跑即可只補送失敗批次")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# audience.py
+# 上傳型受眾（uploaded audience group）的建立 / 增量更新，給 MODE=narrowcast 用
+# 本地快取上一次上傳的 id 集合：只新增 → PUT 補上差額；有人要移除 → 重建（上傳型受眾不能刪個別 id）
+import os, json, time
+import line_api
+from line_api import API_DATA, must_ok, state_path
+
+def _ids_file(ids):
+    return ("\n".join(ids) + "\n").encode("utf-8")
+
+# ---------- API ----------
+def create_audience(token, description, ids):
+    """一次 multipart 上傳整份 id 檔（byFile 上限 150 萬人），回傳 audienceGroupId"""
+    r = line_api.post(token, f"{API_DATA}/audienceGroup/upload/byFile",
+                      data={"description": description, "uploadDescription": f"{len(ids)} ids"},
+                      files={"file": ("ids.txt", _ids_file(ids), "text/plain")})
+    must_ok(r, f"create audience {description} ({len(ids)} ids)")
+    return r.json()["audienceGroupId"]
+
+def add_to_audience(token, group_id, ids):
+    r = line_api.put(token, f"{API_DATA}/audienceGroup/upload/byFile",
+                     data={"audienceGroupId": str(group_id), "uploadDescription": f"+{len(ids)} ids"},
+                     files={"file": ("ids.txt", _ids_file(ids), "text/plain")})
+    must_ok(r, f"add {len(ids)} ids -> audience {group_id}")
+
+def get_audience(token, group_id):
+    """回傳 audienceGroup 物件；不存在（被刪、過期清掉）回傳 None"""
+    r = line_api.get(token, f"/audienceGroup/{group_id}")
+    if r.status_code in (400, 404):
+        return None
+    must_ok(r, f"get audience {group_id}")
+    return r.json().get("audienceGroup", {})
+
+def delete_audience(token, group_id):
+    r = line_api.delete(token, f"/audienceGroup/{group_id}")
+    if r.status_code not in (400, 404):     # 已經不在就算了
+        must_ok(r, f"delete audience {group_id}")
+
+def wait_ready(token, group_id, timeout=None, interval=None):
+    """上傳後 LINE 要先比對 id（IN_PROGRESS），READY 之後才能拿來 narrowcast"""
+    timeout  = float(timeout or os.getenv("AUDIENCE_TIMEOUT", "600"))
+    interval = float(interval or os.getenv("AUDIENCE_POLL", "5"))
+    start = time.monotonic()
+    while True:
+        group = get_audience(token, group_id) or {}
+        status = group.get("status")
+        if status == "READY":
+            print(f"[Audience] {group_id} READY（{group.get('audienceCount', '?')} 人）")
+            return group
+        if status in ("FAILED", "EXPIRED", None):
+            print(f"[ERROR] audience {group_id}: status={status} {group.get('failedType') or ''}")
+            raise SystemExit(1)
+        if time.monotonic() - start > timeout:
+            print(f"[ERROR] audience {group_id} 等了 {timeout:.0f}s 仍是 {status}")
+            raise SystemExit(1)
+        time.sleep(interval)
+
+# ---------- 本地快取 ----------
+class AudienceCache:
+    """state_path 下兩個檔：<name>.json（audienceGroupId 等）與 <name>.ids（排序後的 id，一行一個）"""
+    def __init__(self, token, name):
+        self.meta_path = state_path(f"audience_{name}.json", token)
+        self.ids_path  = state_path(f"audience_{name}.ids", token)
+
+    def load(self):
+        try:
+            with open(self.meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(self.ids_path, encoding="utf-8") as f:
+                ids = {line.strip() for line in f if line.strip()}
+            return meta, ids
+        except (OSError, ValueError):
+            return None, set()
+
+    def save(self, group_id, ids):
+        os.makedirs(os.path.dirname(self.meta_path), exist_ok=True)
+        for path, text in ((self.ids_path, "".join(f"{uid}\n" for uid in sorted(ids))),
+                           (self.meta_path, json.dumps({"audienceGroupId": group_id, "count": len(ids),
+                                                        "updated_at": int(time.time())}))):
+            tmp = f"{path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, path)
+
+def sync_audience(token, ids, name="daily-push"):
+    """讓名為 name 的上傳型受眾剛好等於 ids，回傳 READY 的 audienceGroupId：
+       - 沒有快取 / 受眾已失效 → 建立新的
+       - 只多了人 → PUT 補上新增的 id
+       - 有人要移除 → 建新受眾，READY 後再刪舊的
+    """
+    ids = set(ids)
+    if not ids:
+        print("[ERROR] narrowcast 沒有任何對象")
+        raise SystemExit(1)
+    cache = AudienceCache(token, name)
+    meta, cached = cache.load()
+    group_id = meta and meta.get("audienceGroupId")
+    if group_id and (get_audience(token, group_id) or {}).get("status") not in ("READY", "IN_PROGRESS"):
+        print(f"[Audience] 快取的受眾 {group_id} 已不存在或失效，重新建立")
+        group_id = None
+
+    added, removed = ids - cached, cached - ids
+    old = None
+    if not group_id:
+        group_id = create_audience(token, name, sorted(ids))
+    elif removed:
+        print(f"[Audience] 移除 {len(removed)} 人、新增 {len(added)} 人 → 重建受眾（上傳型受眾不能刪 id）")
+        old, group_id = group_id, create_audience(token, name, sorted(ids))
+    elif added:
+        print(f"[Audience] 受眾 {group_id} 新增 {len(added)} 人")
+        add_to_audience(token, group_id, sorted(added))
+    else:
+        print(f"[Audience] 受眾 {group_id} 沒有變動（{len(ids)} 人）")
+
+    wait_ready(token, group_id)
+    cache.save(group_id, ids)
+    if old:
+        delete_audience(token, old)
+    return group_id
@@ -0,0 +1,121 @@
+# bench_line.py
+# 離線效能基準：對本地 LINE API 替身（line_stub.py）量 push 吞吐與 rich menu 部署時間
+# 用法：python richmenu/bench_line.py --sizes 1000,100000,1000000 --latency 30
+import os, sys, json, time, argparse, tempfile, contextlib
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+TOKEN = "bench-token"
+
+def setup_env(base):
+    """必須在 import line_api 之前設定（API 位址在 import 時決定）"""
+    os.environ["LINE_API_BASE"] = base
+    os.environ["LINE_API_DATA_BASE"] = base
+    os.environ["LINE_TOKEN"] = TOKEN
+    os.environ.setdefault("STATE_DIR", tempfile.mkdtemp(prefix="line-bench-"))
+    os.environ.setdefault("METRICS", "0")
+    os.environ.setdefault("STATS_COLLECT", "0")      # 成效統計的請求不算進發送的 benchmark
+
+@contextlib.contextmanager
+def quiet(enabled=True):
+    """壓掉腳本本身的 [OK] 輸出，只留 bench 結果"""
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+def bench_push(state, sizes, verbose):
+    import line_api, daily_push
+    rows = []
+    for n in sizes:
+        state.followers, state.usage = n, 0
+        line_api._clients.clear()              # 每輪都從冷連線開始
+        before = sum(state.counts.values())
+        t = time.perf_counter()
+        try:
+            with quiet(not verbose):
+                failed = daily_push.dispatch_multicast(TOKEN, daily_push.iter_followers(TOKEN), "bench")
+        except SystemExit:                     # followers/ids 重試後仍失敗
+            failed = None
+        wall = time.perf_counter() - t
+        rows.append({"case": f"push multicast {n:,}", "seconds": round(wall, 3),
+                     "users_per_s": round(n / wall, 1), "requests": sum(state.counts.values()) - before,
+                     "failed_chunks": "aborted" if failed is None else len(failed)})
+    return rows
+
+def run_script(module, argv, verbose):
+    """執行腳本的 main()；must_ok 失敗（SystemExit）回傳 False，不讓整個 bench 中斷"""
+    old = sys.argv
+    sys.argv = [module.__file__] + argv
+    try:
+        with quiet(not verbose):
+            module.main()
+        return True
+    except SystemExit as e:
+        return not e.code
+    finally:
+        sys.argv = old
+
+def bench_deploy(state, verbose):
+    import line_api, menu_image, deploy_richmenu, deploy_richmenu_alias
+    line = HERE / "line"
+    rows = []
+    single = ["--image", str(line / "richmenu_comp.jpg"), "--set-default", "--delete-others"]
+    alias  = ["--imageA", str(line / "menu_1.PNG"), "--imageB", str(line / "menu_2.PNG"),
+              "--set-default", "menu-a", "--delete-others"]
+    cases = [("deploy single", deploy_richmenu, single), ("deploy alias A/B", deploy_richmenu_alias, alias)]
+    for name, module, argv in cases:
+        state.menus.clear(); state.images.clear(); state.aliases.clear(); state.default_menu = None
+        for label in ("cold", "unchanged"):
+            if label == "cold":
+                for f in Path(menu_image.CACHE_DIR).glob("*.jpg"):
+                    f.unlink()                 # 冷啟動：連圖片快取也清掉
+            line_api._clients.clear()
+            before = sum(state.counts.values())
+            t = time.perf_counter()
+            ok = run_script(module, argv, verbose)
+            rows.append({"case": f"{name} ({label})", "seconds": round(time.perf_counter() - t, 3),
+                         "requests": sum(state.counts.values()) - before, "ok": ok})
+    return rows
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="1000,100000,1000000", help="push 的好友數（逗號分隔）")
+    ap.add_argument("--latency", type=float, default=30.0, help="替身每個請求的延遲（毫秒）")
+    ap.add_argument("--jitter", type=float, default=5.0)
+    ap.add_argument("--rate-limit", default="", help="例如 multicast=200")
+    ap.add_argument("--error-429", type=float, default=0.0)
+    ap.add_argument("--error-500", type=float, default=0.0)
+    ap.add_argument("--skip", choices=["push", "deploy"], action="append", default=[])
+    ap.add_argument("--json", help="結果另存 JSON")
+    ap.add_argument("-v", "--verbose", action="store_true", help="顯示腳本本身的輸出")
+    args = ap.parse_args()
+
+    import line_stub
+    state = line_stub.StubState(latency_ms=args.latency, jitter_ms=args.jitter,
+                                rate_limits=line_stub.parse_rate_limits(args.rate_limit),
+                                error_429=args.error_429, error_500=args.error_500, seed=1)
+    server, base = line_stub.start(state)
+    setup_env(base)
+    print(f"[Bench] stub={base} latency={args.latency}±{args.jitter}ms "
+          f"429={args.error_429} 500={args.error_500} workers={os.getenv('PUSH_WORKERS', '8')}")
+
+    rows = []
+    try:
+        if "push" not in args.skip:
+            rows += bench_push(state, [int(s) for s in args.sizes.split(",") if s], args.verbose)
+        if "deploy" not in args.skip:
+            rows += bench_deploy(state, args.verbose)
+    finally:
+        server.shutdown()
+
+    for r in rows:
+        extra = "  ".join(f"{k}={v}" for k, v in r.items() if k not in ("case", "seconds"))
+        print(f"  {r['case']:<32} {r['seconds']:>9.3f}s  {extra}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": rows}, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# bench_startup.py
+# 冷啟動基準：每次都開新的 python process（同 cron / GitHub Actions），量 import 時間與「啟動到第一個請求」的時間
+# - import：python -c "import X" 的整體時間（含直譯器本身，另列 python -c pass 當基準）
+# - first request / wall：對本地替身（line_stub.py）跑一次 daily_push（broadcast），每輪都用新的 STATE_DIR
+# - HTTP_CLIENT=stdlib（line_http）與 requests 兩種傳輸層並列；沒裝 requests 就只跑 stdlib
+# 用法：python richmenu/bench_startup.py [--repeat 7] [--json startup.json]
+import os, sys, json, time, argparse, tempfile, statistics, subprocess
+import importlib.util
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+TOKEN = "bench-token"
+
+def clients():
+    return ["stdlib"] + (["requests"] if importlib.util.find_spec("requests") else [])
+
+def env_for(base, client, state_dir):
+    return {**os.environ, "LINE_API_BASE": base, "LINE_API_DATA_BASE": base, "LINE_TOKEN": TOKEN,
+            "HTTP_CLIENT": client, "STATE_DIR": state_dir, "METRICS": "0", "STATS_COLLECT": "0",
+            "MODE": "broadcast"}
+
+def run(argv, env):
+    t = time.perf_counter()
+    p = subprocess.run([sys.executable] + argv, cwd=HERE, env=env, capture_output=True, text=True)
+    if p.returncode:
+        raise RuntimeError(f"{' '.join(argv)} 失敗（exit {p.returncode}）：{p.stderr.strip()[-500:]}")
+    return time.perf_counter() - t
+
+def median_ms(samples):
+    return round(statistics.median(samples) * 1000, 1)
+
+def bench_imports(base, repeat):
+    """各入口模組的 import 時間；第一輪只用來產生 .pyc，不計入"""
+    cases = [("python (baseline)", "pass", "stdlib")]
+    for client in clients():
+        cases.append((f"import daily_push [{client}]", "import daily_push", client))
+    cases += [("import deploy_richmenu", "import deploy_richmenu", "stdlib"),
+              ("import deploy_richmenu_alias", "import deploy_richmenu_alias", "stdlib"),
+              ("import menu_render (grid)", "import menu_render", "stdlib")]
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="line-startup-") as d:
+        for name, code, client in cases:
+            env = env_for(base, client, d)
+            run(["-c", code], env)
+            samples = [run(["-c", code], env) for _ in range(repeat)]
+            rows.append({"case": name, "ms": median_ms(samples), "min_ms": round(min(samples) * 1000, 1)})
+    return rows
+
+def bench_first_request(state, base, repeat):
+    """整支 daily_push 從 exec 到第一個請求打到替身、以及跑完的時間"""
+    rows = []
+    for client in clients():
+        first, wall = [], []
+        for _ in range(repeat + 1):
+            with tempfile.TemporaryDirectory(prefix="line-startup-") as d:
+                env = env_for(base, client, d)
+                state.first_at = None
+                t0 = time.perf_counter()
+                run([str(HERE / "daily_push.py")], env)
+                t1 = time.perf_counter()
+            if state.first_at is None:
+                raise RuntimeError("daily_push 沒有送出任何請求")
+            first.append(state.first_at - t0)
+            wall.append(t1 - t0)
+        first, wall = first[1:], wall[1:]         # 第一輪含 .pyc 編譯，不計入
+        rows.append({"case": f"daily_push broadcast [{client}]", "ms": median_ms(wall),
+                     "first_request_ms": median_ms(first)})
+    return rows
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=7, help="每個情境跑幾次（取中位數）")
+    ap.add_argument("--latency", type=float, default=0.0, help="替身每個請求的延遲（毫秒）")
+    ap.add_argument("--skip", choices=["import", "run"], action="append", default=[])
+    ap.add_argument("--json", help="結果另存 JSON")
+    args = ap.parse_args()
+
+    import line_stub
+    state = line_stub.StubState(latency_ms=args.latency, seed=1)
+    server, base = line_stub.start(state)
+    print(f"[Bench] stub={base} python={sys.version.split()[0]} clients={','.join(clients())} repeat={args.repeat}")
+
+    rows = []
+    try:
+        if "import" not in args.skip:
+            rows += bench_imports(base, args.repeat)
+        if "run" not in args.skip:
+            rows += bench_first_request(state, base, args.repeat)
+    finally:
+        server.shutdown()
+
+    for r in rows:
+        extra = "  ".join(f"{k}={v}" for k, v in r.items() if k not in ("case", "ms"))
+        print(f"  {r['case']:<36} {r['ms']:>8.1f}ms  {extra}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": rows}, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
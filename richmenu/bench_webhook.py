@@ -0,0 +1,129 @@
+# bench_webhook.py
+# webhook 負載測試：本地 LINE API 替身（line_stub.py）+ webhook_server，同一個 process 內跑
+# 量兩段延遲：webhook 回 200 的時間（ack），以及替身收到 reply 的時間（端到端，reply token 時限內）
+# 用法：python richmenu/bench_webhook.py --events 5000 --concurrency 50 --latency 30 [--rate 500]
+import os, json, time, random, asyncio, argparse, tempfile, threading
+
+TOKEN, SECRET = "bench-token", "bench-secret"
+POSTBACKS = ["sec=contact", "sec=events&page=1", "sec=events&page=2",
+             "sec=musicians&page=1", "sec=musicians&page=2", "sec=actors&page=1", "sec=actors&page=2"]
+
+def setup_env(base):
+    """必須在 import line_api 之前設定（API 位址在 import 時決定）"""
+    os.environ["LINE_API_BASE"] = base
+    os.environ["LINE_API_DATA_BASE"] = base
+    os.environ.setdefault("STATE_DIR", tempfile.mkdtemp(prefix="line-bench-"))
+    os.environ.setdefault("METRICS", "0")
+
+def event_body(i, data):
+    ev = {"type": "postback", "mode": "active", "timestamp": int(time.time() * 1000),
+          "source": {"type": "user", "userId": f"U{i:032x}"}, "replyToken": f"rt-{i}",
+          "webhookEventId": f"ev-{i}", "postback": {"data": data}}
+    return json.dumps({"destination": "Ubench", "events": [ev]}).encode("utf-8")
+
+async def client(host, port, path, jobs, sign, results, rate=0.0, t0=0.0):
+    """一條 keep-alive 連線，依序送 jobs 裡的事件；rate>0 時第 i 個事件排在 t0 + i/rate 送出（開環負載）"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while jobs:
+            i, data = jobs.pop()
+            if rate:
+                await asyncio.sleep(max(0.0, t0 + i / rate - time.monotonic()))
+            body = event_body(i, data)
+            head = (f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\nX-Line-Signature: {sign(body)}\r\n\r\n")
+            t = time.monotonic()
+            writer.write(head.encode("latin-1") + body)
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                h = await reader.readline()
+                if h in (b"\r\n", b""):
+                    break
+                if h.lower().startswith(b"content-length:"):
+                    length = int(h.split(b":")[1])
+            await reader.readexactly(length)
+            results.append((f"rt-{i}", t, time.monotonic(), status))
+    finally:
+        writer.close()
+
+def run_load(host, port, path, n, concurrency, sign, rate=0.0, seed=1):
+    rng = random.Random(seed)
+    jobs = [(i, rng.choice(POSTBACKS)) for i in reversed(range(n))]     # pop() 從 0 開始
+    results = []
+    async def go():
+        t0 = time.monotonic()
+        await asyncio.gather(*(client(host, port, path, jobs, sign, results, rate, t0) for _ in range(concurrency)))
+    t = time.perf_counter()
+    asyncio.run(go())
+    return results, time.perf_counter() - t
+
+def start_webhook(app):
+    """webhook server 跑在自己的 event loop（背景執行緒），回傳 (loop, port)"""
+    import webhook_server
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    box = {}
+    async def boot():
+        box["server"] = await webhook_server.start_server(app, "127.0.0.1", 0)
+        ready.set()
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(boot())
+        loop.run_forever()
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return loop, box["server"].sockets[0].getsockname()[1]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, default=5000)
+    ap.add_argument("--concurrency", type=int, default=50, help="同時的 webhook 連線數")
+    ap.add_argument("--rate", type=float, default=0.0, help="每秒事件數（0 = 全速灌，量最大吞吐）")
+    ap.add_argument("--latency", type=float, default=30.0, help="替身 reply API 的延遲（毫秒）")
+    ap.add_argument("--jitter", type=float, default=5.0)
+    ap.add_argument("--error-429", type=float, default=0.0)
+    ap.add_argument("--bad-signature", type=float, default=0.0, help="故意簽錯的比例（應回 401、不 reply）")
+    ap.add_argument("--json", help="結果另存 JSON")
+    args = ap.parse_args()
+
+    import line_stub
+    state = line_stub.StubState(latency_ms=args.latency, jitter_ms=args.jitter, error_429=args.error_429, seed=1)
+    server, base = line_stub.start(state)
+    setup_env(base)
+
+    import webhook_server, line_metrics
+    app = webhook_server.build_app(TOKEN, SECRET)
+    loop, port = start_webhook(app)
+    rng = random.Random(2)
+    def sign(body):
+        return "invalid" if rng.random() < args.bad_signature else webhook_server.signature(SECRET, body)
+
+    print(f"[Bench] webhook :{port}  stub={base} latency={args.latency}±{args.jitter}ms "
+          f"events={args.events} concurrency={args.concurrency} rate={args.rate or 'max'}")
+    results, wall = run_load("127.0.0.1", port, app.path, args.events, args.concurrency, sign, args.rate)
+
+    deadline = time.monotonic() + 30          # 等背景 reply 全部送完
+    while app.tasks and time.monotonic() < deadline:
+        time.sleep(0.05)
+    loop.call_soon_threadsafe(loop.stop)
+    server.shutdown()
+
+    ack = sorted(done - start for _, start, done, _ in results)
+    e2e = sorted(state.replies[rt] - start for rt, start, _, status in results if rt in state.replies)
+    row = {"requests": len(results), "wall_s": round(wall, 3), "events_per_s": round(len(results) / wall, 1),
+           "status": {str(s): sum(1 for r in results if r[3] == s) for s in sorted({r[3] for r in results})},
+           "replied": len(e2e), **app.stats}
+    for name, vals in (("ack", ack), ("reply", e2e)):
+        for p in (50, 95, 99):
+            row[f"{name}_p{p}_ms"] = round(line_metrics._pct(vals, p) * 1000, 2)
+        row[f"{name}_max_ms"] = round((vals[-1] if vals else 0) * 1000, 2)
+    for k, v in row.items():
+        print(f"  {k:<16} {v}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": row}, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
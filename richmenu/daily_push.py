@@ -1,63 +1,277 @@
 # daily_push.py
-import os, json, requests, sys
-from datetime import datetime
+import os, json, sys, time, hashlib, argparse, itertools, threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo  # Python 3.9+
-
-API = "https://api.line.me/v2/bot"
-HDR_JSON = lambda token: {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-HDR_GET  = lambda token: {"Authorization": f"Bearer {token}"}
-
-def must_ok(r, what):
-    if not r.ok:
-        print(f"[ERROR] {what}: {r.status_code} {r.text}")
-        sys.exit(1)
-    else:
-        rid = r.headers.get("X-Line-Request-Id", "-")
-        print(f"[OK] {what} (X-Line-Request-Id: {rid})")
+import line_api
+import audience
+import delivery_stats
+from follower_store import FollowerStore
+from line_api import must_ok, dispatch, state_path, Journal
 
 # ---------- Message builders ----------
-def make_default_text():
-    tz = ZoneInfo("Asia/Taipei")
-    now = datetime.now(tz)
+def make_default_text(tz="Asia/Taipei", message=None):
+    now = datetime.now(ZoneInfo(tz))
     wd = ["一","二","三","四","五","六","日"][now.weekday()]  # Mon=0
     hour = now.hour
     greet = "早安" if 5 <= hour < 12 else ("午安" if 12 <= hour < 18 else "晚安")
-    base = os.getenv("MESSAGE", "祝你順心 😊")
+    base = message or os.getenv("MESSAGE", "祝你順心 😊")
     return f"{greet}～今天是 {now:%Y-%m-%d}（{wd}）\n{base}"
 
+MAX_MESSAGES = 5             # 一個請求最多 5 個 message 物件（計費以請求 × 人數計）
+
+def as_messages(text):
+    """字串 → 一則文字訊息；message 物件 list 原樣使用（1~5 則）"""
+    msgs = [{"type": "text", "text": text}] if isinstance(text, str) else list(text)
+    if not 1 <= len(msgs) <= MAX_MESSAGES:
+        raise ValueError(f"一個請求要有 1~{MAX_MESSAGES} 則訊息（收到 {len(msgs)} 則）")
+    return msgs
+
 # ---------- Senders ----------
+# text 可以是字串，或 message 物件 list（最多 5 則，一起送只算一次請求）
 def send_broadcast(token, text):
-    url = f"{API}/message/broadcast"
-    body = {"messages": [{"type": "text", "text": text}]}
-    r = requests.post(url, headers=HDR_JSON(token), data=json.dumps(body).encode("utf-8"))
+    """回傳 request id（之後用來查單則統計）"""
+    body = {"messages": as_messages(text)}
+    r = line_api.post(token, "/message/broadcast", json_body=body)
     must_ok(r, "broadcast")
+    return r.headers.get("X-Line-Accepted-Request-Id") or r.headers.get("X-Line-Request-Id")
+
+def post_multicast(token, user_ids, text, retry_key=None, max_retries=None):
+    """送出 multicast 並回傳 response（不檢查成功與否，交給呼叫端處理）
+       retry_key：重送時沿用同一把，LINE 會去重；max_retries=0 表示重試交給呼叫端（dispatcher）
+    """
+    body = {"to": user_ids, "messages": as_messages(text)}
+    return line_api.post(token, "/message/multicast", json_body=body,
+                         retry_key=retry_key, max_retries=max_retries)
 
 def send_multicast(token, user_ids, text):
-    url = f"{API}/message/multicast"
-    body = {"to": user_ids, "messages": [{"type": "text", "text": text}]}
-    r = requests.post(url, headers=HDR_JSON(token), data=json.dumps(body).encode("utf-8"))
+    r = post_multicast(token, user_ids, text)
     must_ok(r, f"multicast ({len(user_ids)} users)")
 
+def send_narrowcast(token, group_id, text):
+    """對上傳型受眾送一次 narrowcast，回傳 request id（之後用來查進度）"""
+    body = {"messages": as_messages(text),
+            "recipient": {"type": "audience", "audienceGroupId": group_id}}
+    r = line_api.post(token, "/message/narrowcast", json_body=body)
+    must_ok(r, f"narrowcast -> audience {group_id}")
+    # 重試撞到 409 時，真正被收下的是第一次的 request
+    return r.headers.get("X-Line-Accepted-Request-Id") or r.headers.get("X-Line-Request-Id")
+
+def wait_narrowcast(token, request_id, timeout=None, interval=None):
+    """輪詢 narrowcast 進度直到 succeeded / failed；回傳最後一次的進度物件"""
+    timeout  = float(timeout or os.getenv("NARROWCAST_TIMEOUT", "1800"))
+    interval = float(interval or os.getenv("NARROWCAST_POLL", "10"))
+    start = time.monotonic()
+    while True:
+        r = line_api.get(token, "/message/progress/narrowcast", params={"requestId": request_id})
+        must_ok(r, "narrowcast progress")
+        p = r.json()
+        phase = p.get("phase")
+        print(f"[Progress] narrowcast {phase}: 成功 {p.get('successCount', 0)} / 失敗 {p.get('failureCount', 0)}"
+              f" / 目標 {p.get('targetCount', '?')}")
+        if phase in ("succeeded", "failed"):
+            return p
+        if time.monotonic() - start > timeout:
+            print(f"[WARN] narrowcast {request_id} 等了 {timeout:.0f}s 仍在 {phase}，不再等待（LINE 端會繼續送）")
+            return p
+        time.sleep(interval)
+
+# ---------- Concurrent dispatcher ----------
+def dispatch_multicast(token, user_ids, text, size=500, ledger=None, journal=None, on_sent=None):
+    """user_ids 可以是 list 或串流（例如 iter_followers）；每湊滿一批就送出
+       journal：跳過已成功的批次、每批的 retry key 與結果都寫進去（續跑時同一批沿用同一把 key）
+       on_sent(人數, request id)：每批成功時呼叫（例如累計實際送出人數）
+    """
+    # 一次最多 500 人；有 journal 時先補送上次未確認的批次，再送還沒成功過的人
+    chunks = resume_chunks(user_ids, journal, size) if journal else batched(user_ids, size)
+    def on_result(idx, chunk, ok, info):
+        if journal:
+            journal.record(chunk, ok, info)
+        if ok and on_sent:
+            on_sent(len(chunk), info)
+    return dispatch(chunks, lambda ids, key: post_multicast(token, ids, text, key, max_retries=0),
+                    "multicast", endpoint="multicast", budget=ledger,
+                    bucket=line_api.client(token).bucket("multicast"),
+                    on_result=on_result, retry_key=journal and journal.retry_key)
+
+def resume_chunks(ids, journal, size=500):
+    """journal 續跑：先原樣補送未確認的批次（同一把 retry key），再把沒成功過的人重新分批；
+       以 userId 判斷，中間有人加入 / 封鎖讓批次邊界移動，也不會重送給已成功的人
+    """
+    pending = journal.pending()
+    if pending or journal.acked:
+        print(f"[Resume] 略過已成功的 {len(journal.acked)} 人；先補送 {len(pending)} 批未確認的批次")
+    return itertools.chain(pending, batched(journal.remaining(ids), size))
+
+def run_id(env=None):
+    """這一輪推播的識別：RUN_ID，預設「台北日期 + MESSAGE」。
+       不用訊息全文：make_default_text 的問候語跟著時段變，11:50 失敗、12:10 續跑會對不上
+    """
+    env = os.environ if env is None else env
+    return env.get("RUN_ID") or f"{datetime.now(ZoneInfo('Asia/Taipei')):%Y-%m-%d}:{env.get('MESSAGE', '')}"
+
+def multicast_journal(token, run):
+    """同一輪（run_id；排程用 campaign + 觸發時間）共用一個 journal"""
+    h = hashlib.sha256(run.encode("utf-8")).hexdigest()[:12]
+    return Journal(state_path(f"multicast_{h}.jsonl", token))
+
 # ---------- Helpers ----------
-def list_followers(token, limit=1000):
-    url = f"{API}/followers/ids"
-    params, ids, start = {"limit": limit}, [], None
+def iter_followers(token, limit=1000):
+    """逐頁 yield 好友 id（以 API 回傳的 next 游標為準），不必等全部抓完"""
+    params, start = {"limit": limit}, None
     while True:
         if start: params["start"] = start
-        r = requests.get(url, headers=HDR_GET(token), params=params)
+        r = line_api.get(token, "/followers/ids", params=params)
         must_ok(r, "get followers/ids")
         data = r.json()
-        ids.extend(data.get("userIds", []))
+        yield from data.get("userIds", [])
         start = data.get("next")
         if not start: break
+
+def list_followers(token, limit=1000):
+    return list(iter_followers(token, limit))
+
+def env_ids(name, env=None):
+    return [s.strip() for s in (env if env is not None else os.environ).get(name, "").split(",") if s.strip()]
+
+def follower_store(token, path=None, rescan_hours=None):
+    """FOLLOWER_STORE=<路徑前綴> 時使用本地好友 store（webhook 的 follow/unfollow 會即時更新它）；
+       距上次完整掃描超過 FOLLOWER_RESCAN_HOURS 才重掃一次 followers/ids 當一致性檢查
+       path / rescan_hours 沒給就讀環境變數（path="" = 不用 store）
+    """
+    path = os.getenv("FOLLOWER_STORE") if path is None else path
+    if not path:
+        return None
+    store = FollowerStore(path).open()
+    if store.stale(float(rescan_hours or os.getenv("FOLLOWER_RESCAN_HOURS", "168")) * 3600):
+        store.rescan(iter_followers(token))
+    else:
+        print(f"[Followers] 使用本地 store {store.bin_path}：{len(store)} 人（上次完整掃描 "
+              f"{datetime.fromtimestamp(store.meta()['scanned_at'], ZoneInfo('Asia/Taipei')):%Y-%m-%d %H:%M}）")
+    return store
+
+def target_ids(token, store=None, include=None, exclude=None, followers=None):
+    """推播對象串流：(好友 ∪ include) − exclude（預設取 INCLUDE_IDS / EXCLUDE_IDS）
+       有 store 就從 store 讀；否則用 followers（已抓好的清單）或串流 followers/ids
+    """
+    include = env_ids("INCLUDE_IDS") if include is None else include
+    exclude = env_ids("EXCLUDE_IDS") if exclude is None else exclude
+    if store is not None:
+        return store.targets(include=include, exclude=exclude)
+    ids = iter(followers) if followers is not None else iter_followers(token)
+    if include:
+        inc = set(include)
+        ids = itertools.chain(inc, (uid for uid in ids if uid not in inc))
+    if exclude:
+        exc = set(exclude)
+        ids = (uid for uid in ids if uid not in exc)
     return ids
 
+# ---------- Cost estimate ----------
+def get_insight_followers(token, date):
+    """GET /insight/followers?date=yyyyMMdd → {"status", "followers", "targetedReaches", "blocks"}
+       統計以 UTC+9 的日期為準，前一天的數字隔天才會是 ready
+       失敗回傳 None：只給預估用，不能像 must_ok 那樣結束程式
+    """
+    r = line_api.get(token, "/insight/followers", params={"date": f"{date:%Y%m%d}"})
+    if not r.ok:
+        print(f"[WARN] insight followers {date:%Y-%m-%d}: {r.status_code} {r.text}")
+        return None
+    return r.json()
+
+def insight_follower_count(token):
+    """最近一天已產出的「好友 − 封鎖」人數；都還沒 ready 回傳 None"""
+    today = datetime.now(ZoneInfo("Asia/Tokyo")).date()
+    for back in (1, 2):
+        data = get_insight_followers(token, today - timedelta(days=back))
+        if data is None:
+            return None
+        if data.get("status") == "ready" and data.get("followers") is not None:
+            return int(data["followers"]) - int(data.get("blocks") or 0), f"{today - timedelta(days=back):%Y-%m-%d}"
+    return None
+
+def count_followers(token, limit=1000):
+    """翻完 followers/ids 只算人數；失敗（例如未認證帳號的 403）回傳 None，不結束程式"""
+    params, n = {"limit": limit}, 0
+    while True:
+        r = line_api.get(token, "/followers/ids", params=params)
+        if not r.ok:
+            print(f"[WARN] get followers/ids: {r.status_code} {r.text}")
+            return None
+        data = r.json()
+        n += len(data.get("userIds", []))
+        if not data.get("next"):
+            return n
+        params["start"] = data["next"]
+
+def estimate_broadcast_cost(token, ttl=None, store_path=None, rescan_hours=None):
+    """broadcast 的預估人數，依序嘗試（越前面越便宜）：
+       1) 本地好友 store（FOLLOWER_STORE，且未超過 FOLLOWER_RESCAN_HOURS）→ 直接 len，不打 API
+       2) insight 統計的本地快取（FOLLOWER_COUNT_TTL 秒內）
+       3) GET /insight/followers（一個請求）
+       4) 都拿不到才完整翻 followers/ids
+       store_path / rescan_hours 沒給就讀環境變數（同 follower_store）
+       預估只是配額保護用，不能擋住發送：API 錯誤（insight 錯誤、未認證帳號的 followers/ids 403…）
+       或連線失敗都只警告並回傳 0
+    """
+    try:
+        count = _estimate_broadcast_cost(token, ttl, store_path, rescan_hours)
+    except Exception as e:
+        print(f"[WARN] 無法預估 broadcast 人數（{type(e).__name__}: {e}）")
+        count = None
+    if count is None:
+        print("[WARN] 以 0 繼續發送（只剩月額度 / 已用量的保護）")
+        return 0
+    return count
+
+def _estimate_broadcast_cost(token, ttl, store_path, rescan_hours):
+    path = os.getenv("FOLLOWER_STORE") if store_path is None else store_path
+    if path:
+        store = FollowerStore(path).open()
+        if not store.stale(float(rescan_hours or os.getenv("FOLLOWER_RESCAN_HOURS", "168")) * 3600):
+            print(f"[Estimate] 來源：本地好友 store（{len(store)} 人）")
+            return len(store)
+
+    ttl = float(ttl if ttl is not None else os.getenv("FOLLOWER_COUNT_TTL", "43200"))     # 預設 12 小時
+    cache = state_path("follower_count.json", token)
+    try:
+        with open(cache, encoding="utf-8") as f:
+            data = json.load(f)
+        if time.time() - data["fetched_at"] < ttl:
+            print(f"[Estimate] 來源：insight 快取（{data['date']}）")
+            return int(data["count"])
+    except (OSError, ValueError, KeyError):
+        pass
+
+    found = insight_follower_count(token)
+    if found:
+        count, date = found
+        os.makedirs(os.path.dirname(cache), exist_ok=True)
+        with open(cache, "w", encoding="utf-8") as f:
+            json.dump({"count": count, "date": date, "fetched_at": time.time()}, f)
+        print(f"[Estimate] 來源：insight 統計（{date}，好友 − 封鎖）")
+        return count
+
+    print("[Estimate] insight 統計尚未產出，改為完整掃描 followers/ids（較慢）…")
+    return count_followers(token)
+
+def batched(ids, size=500):
+    """把 id 串流切成每批 size 個（最後一批可能較少）"""
+    batch = []
+    for uid in ids:
+        batch.append(uid)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
 def get_month_quota(token):
     """Return (quota_type, quota_value or None)
        quota_type: 'limited' / 'unlimited' / 'none'(某些方案)
        quota_value: 當月可用總額度（僅 limited 時有數字）
     """
-    r = requests.get(f"{API}/message/quota", headers=HDR_GET(token))
+    r = line_api.get(token, "/message/quota")
     must_ok(r, "get monthly quota")
     data = r.json()
     qtype = data.get("type")
@@ -66,70 +280,167 @@ def get_month_quota(token):
 
 def get_month_consumption(token):
     """Return totalUsage（本月已用量）"""
-    r = requests.get(f"{API}/message/quota/consumption", headers=HDR_GET(token))
+    r = line_api.get(token, "/message/quota/consumption")
     must_ok(r, "get monthly consumption")
     data = r.json()
     return int(data.get("totalUsage", 0))
 
-def should_skip_by_quota(token, expected_cost=0):
+# ---------- Quota ledger ----------
+class QuotaLedger:
+    """本月配額帳本：
+       - quota（很少變）快取在本地狀態檔，TTL 內不再打 API；consumption 每次都抓
+       - 需要兩個都抓時併發進行，啟動只付一次來回的延遲
+       - 發送時每批先 reserve() 扣本地帳，超過 QUOTA_STOP_PERCENT / QUOTA_MIN_REMAIN 就中途停止
+    """
+    def __init__(self, token, stop_percent=None, min_remain=None, ttl=None):
+        self.token = token
+        self.stop_percent = float(stop_percent if stop_percent is not None else os.getenv("QUOTA_STOP_PERCENT", "0.95"))  # 95%
+        self.min_remain   = int(min_remain if min_remain is not None else os.getenv("QUOTA_MIN_REMAIN", "0"))           # 例如保留 500 則
+        self.ttl   = float(ttl if ttl is not None else os.getenv("QUOTA_CACHE_TTL", "21600"))                           # 預設 6 小時
+        self.path  = state_path("quota.json", token)
+        self.qtype, self.qval, self.used = None, None, 0
+        self.lock  = threading.Lock()
+
+    def _cached_quota(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if time.time() - data["fetched_at"] < self.ttl:
+                return data["type"], data["value"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+
+    def _save_quota(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"type": self.qtype, "value": self.qval, "fetched_at": time.time()}, f)
+
+    def load(self):
+        cached = self._cached_quota()
+        if cached:
+            self.qtype, self.qval = cached
+            self.used = get_month_consumption(self.token)
+            print(f"[Quota] 使用快取額度 type={self.qtype}, quota={self.qval}")
+        else:
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                fq = line_api.submit(pool, get_month_quota, self.token)
+                fu = line_api.submit(pool, get_month_consumption, self.token)
+                (self.qtype, self.qval), self.used = fq.result(), fu.result()
+            self._save_quota()
+        return self
+
+    @property
+    def limited(self):
+        return self.qtype == "limited" and bool(self.qval)
+
+    @property
+    def remain(self):
+        return int(self.qval) - int(self.used) if self.limited else None
+
+    def reasons(self, cost=0, used=None):
+        """回傳觸發保護的原因（空 list = 可以發）"""
+        if not self.limited:
+            return []
+        used   = self.used if used is None else used
+        remain = int(self.qval) - int(used)
+        ratio  = used / self.qval
+        reasons = []
+        if ratio >= self.stop_percent:
+            reasons.append(f"已用量比例 {ratio:.1%} ≥ 門檻 {self.stop_percent:.0%}")
+        if remain <= self.min_remain:
+            reasons.append(f"剩餘 {remain} ≤ 保留下限 {self.min_remain}")
+        if cost and cost > remain:
+            reasons.append(f"本次預估需 {cost} > 剩餘 {remain}")
+        return reasons
+
+    def reserve(self, cost):
+        """預扣 cost 則；扣完會超過門檻就拒絕（回傳 False）"""
+        with self.lock:
+            if not self.limited:
+                return True
+            after = self.used + cost
+            # 與 reasons() 相同的邊界（≥ 門檻、≤ 保留下限）：扣完後不能落在啟動時就會被擋下的狀態
+            over = (after / self.qval >= self.stop_percent) or (int(self.qval) - after <= self.min_remain)
+            if cost > self.remain or over:
+                print(f"[Quota] 預扣 {cost} 會超過保護門檻（used={self.used}, remain={self.remain}）")
+                return False
+            self.used = after
+            return True
+
+    def refund(self, cost):
+        with self.lock:
+            self.used -= cost
+
+def should_skip_by_quota(token, expected_cost=0, ledger=None):
     """依環境變數決定是否跳過發送"""
-    stop_percent = float(os.getenv("QUOTA_STOP_PERCENT", "0.95"))  # 95%
-    min_remain   = int(os.getenv("QUOTA_MIN_REMAIN", "0"))         # 例如保留 500 則
-    qtype, qval  = get_month_quota(token)
-    used         = get_month_consumption(token)
+    ledger = ledger or QuotaLedger(token).load()
 
-    if qtype != "limited" or not qval:
-        print(f"[Quota] type={qtype}（無上限或無需計）→ 不啟動保護，繼續。")
+    if not ledger.limited:
+        print(f"[Quota] type={ledger.qtype}（無上限或無需計）→ 不啟動保護，繼續。")
         return False
 
-    remain = int(qval) - int(used)
-    ratio  = used / qval if qval else 0.0
-    print(f"[Quota] plan={qtype}, quota={qval}, used={used}, remain={remain}, ratio={ratio:.3f}")
-
-    reasons = []
-    if ratio >= stop_percent:
-        reasons.append(f"已用量比例 {ratio:.1%} ≥ 門檻 {stop_percent:.0%}")
-    if remain <= min_remain:
-        reasons.append(f"剩餘 {remain} ≤ 保留下限 {min_remain}")
-    if expected_cost and expected_cost > remain:
-        reasons.append(f"本次預估需 {expected_cost} > 剩餘 {remain}")
+    ratio = ledger.used / ledger.qval
+    print(f"[Quota] plan={ledger.qtype}, quota={ledger.qval}, used={ledger.used}, remain={ledger.remain}, ratio={ratio:.3f}")
 
+    reasons = ledger.reasons(expected_cost)
     if reasons:
         print("[Skip] 觸發配額保護，不發送。原因： " + "；".join(reasons))
         return True
     return False
 
-def main():
-    token = os.getenv("LINE_TOKEN")
-    if not token:
-        print("請以環境變數 LINE_TOKEN 提供 Channel access token")
-        sys.exit(1)
-
-    mode = os.getenv("MODE", "broadcast").lower()
-    text = make_default_text()
-    dry  = os.getenv("DRY_RUN", "0") == "1"
+def push(token, env=None, resume=False, run=None):
+    """一個 channel 的每日推播；設定（MODE / MESSAGE / USER_IDS / FOLLOWER_STORE / QUOTA_* …）從 env 讀，
+       預設是這個 process 的環境變數。multi_channel.py 會給每個 channel 各自一份 env
+       run：multicast 續跑用的識別（預設 run_id(env)）
+    """
+    env = os.environ if env is None else env
+    mode = env.get("MODE", "broadcast").lower()
+    text = make_default_text(message=env.get("MESSAGE"))
+    dry  = env.get("DRY_RUN", "0") == "1"
+    store_path, rescan_hours = env.get("FOLLOWER_STORE", ""), env.get("FOLLOWER_RESCAN_HOURS")
+    include, exclude = env_ids("INCLUDE_IDS", env), env_ids("EXCLUDE_IDS", env)
 
-    # 預估本次發送成本（可選）：COUNT_FOLLOWERS=1 時估算 broadcast 覆蓋數
+    # 預估本次發送成本：broadcast 用 insight 統計（有快取，一般只要 0~1 個請求）；COUNT_FOLLOWERS=0 可關閉
     expected_cost = 0
-    count_followers = os.getenv("COUNT_FOLLOWERS", "0") == "1"
-    user_ids = []
+    count_followers = env.get("COUNT_FOLLOWERS", "1") == "1"
+    user_ids = env_ids("USER_IDS", env) if mode != "broadcast" else []
+    if user_ids and (include or exclude):
+        print("[WARN] 有 USER_IDS 時直接發給這份名單，INCLUDE_IDS / EXCLUDE_IDS 不套用")
 
     if mode == "broadcast" and count_followers:
-        user_ids = list_followers(token)
-        expected_cost = len(user_ids)
+        expected_cost = estimate_broadcast_cost(token, env.get("FOLLOWER_COUNT_TTL"), store_path, rescan_hours)
         print(f"[Estimate] broadcast 預估對象數量：{expected_cost}")
+    elif mode == "narrowcast":
+        # 對象要整份比對受眾快取，不能串流（記憶體 O(人數)）；但之後只需要一個 narrowcast 請求。
+        # 沒有名單時只接受本地好友 store：串流 followers/ids 每次都是 O(好友數 / 1000) 個請求
+        if not user_ids:
+            store = follower_store(token, store_path, rescan_hours)
+            if store is None:
+                print("[ERROR] narrowcast 需要 USER_IDS 或 FOLLOWER_STORE（不會每次翻完整個 followers/ids）；"
+                      "要發給全部好友請改用 MODE=broadcast")
+                sys.exit(1)
+            user_ids = list(target_ids(token, store, include, exclude))
+        expected_cost = len(user_ids)
+        print(f"[Estimate] narrowcast 目標數量：{expected_cost}")
     elif mode in ("multicast", "push"):
-        raw = os.getenv("USER_IDS", "")
-        if raw.strip():
-            user_ids = [s.strip() for s in raw.split(",") if s.strip()]
+        store = None if user_ids else follower_store(token, store_path, rescan_hours)   # 有名單就不開 store（過期也不重掃）
+        if user_ids:
+            expected_cost = len(user_ids)
+            print(f"[Estimate] multicast 目標數量：{expected_cost}")
+        elif store is not None:
+            user_ids = target_ids(token, store, include, exclude)
+            expected_cost = store.count_targets(include, exclude)
+            print(f"[Estimate] multicast 目標數量（本地 store）：{expected_cost}")
         else:
-            print("[Info] 未提供 USER_IDS，改用 followers API 取得所有好友 id …")
-            user_ids = list_followers(token)
-        expected_cost = len(user_ids)
-        print(f"[Estimate] multicast 目標數量：{expected_cost}")
+            # 邊翻 followers/ids 邊送：抓頁與發送重疊，記憶體只跟批次大小有關
+            print("[Info] 未提供 USER_IDS，改用 followers API 串流取得好友 id（數量未知，不預估成本）…")
+            user_ids = target_ids(token, include=include, exclude=exclude)
 
-    # 配額保護：接近上限就不發
-    if should_skip_by_quota(token, expected_cost=expected_cost):
+    # 配額保護：接近上限就不發；multicast 途中也會逐批扣帳
+    ledger = QuotaLedger(token, env.get("QUOTA_STOP_PERCENT"), env.get("QUOTA_MIN_REMAIN"),
+                         env.get("QUOTA_CACHE_TTL")).load()
+    if should_skip_by_quota(token, expected_cost=expected_cost, ledger=ledger):
         return
 
     if dry:
@@ -137,15 +448,62 @@ def main():
         print(text)
         return
 
-    # 發送
+    # 發送；每次送出都記進成效統計（CAMPAIGN 決定彙總時歸在哪個 campaign）
+    campaign = env.get("CAMPAIGN", "daily-push")
     if mode == "broadcast":
-        send_broadcast(token, text)
+        rid = send_broadcast(token, text)
+        delivery_stats.record_send(token, "broadcast", campaign, expected_cost or None, rid)
+    elif mode == "narrowcast":
+        group_id = audience.sync_audience(token, user_ids, env.get("AUDIENCE_NAME", "daily-push"))
+        rid = send_narrowcast(token, group_id, text)
+        progress = wait_narrowcast(token, rid, env.get("NARROWCAST_TIMEOUT"), env.get("NARROWCAST_POLL"))
+        delivery_stats.record_send(token, "narrowcast", campaign, progress.get("successCount", len(user_ids)), rid)
+        if progress.get("phase") == "failed":
+            print(f"[ERROR] narrowcast 失敗：{progress.get('errorCode')} {progress.get('failedDescription', '')}")
+            sys.exit(1)
     elif mode in ("multicast", "push"):
-        for i in range(0, len(user_ids), 500):  # 一次最多 500 人
-            send_multicast(token, user_ids[i:i+500], text)
+        journal = multicast_journal(token, run or run_id(env))
+        if resume:
+            journal.load()
+        else:
+            journal.reset()
+        sent = []
+        failed = dispatch_multicast(token, user_ids, text, ledger=ledger, journal=journal,
+                                    on_sent=lambda n, rid: sent.append(n))
+        if sent:
+            delivery_stats.record_send(token, "multicast", campaign, sum(sent))
+        if failed:
+            print(f"[ERROR] {len(failed)} 批發送失敗，共 {sum(len(c) for _, c, _ in failed)} 人；"
+                  f"以 --resume（或 RESUME=1）重跑只會補送還沒成功的人（跨日續跑要指定同一個 --run-id / RUN_ID）")
+            sys.exit(1)
     else:
-        print(f"未知 MODE='{mode}'（允許 broadcast / multicast / push）")
+        print(f"[ERROR] 未知 MODE='{mode}'（允許 broadcast / multicast / push / narrowcast）")
+        sys.exit(1)
+    collect_stats(token, env)
+
+def collect_stats(token, env=None):
+    """送出後順便收集之前各次發送的成效（到期的才抓）；STATS_COLLECT=0 關閉，失敗不影響發送結果"""
+    if (env if env is not None else os.environ).get("STATS_COLLECT", "1") != "1":
+        return
+    try:
+        delivery_stats.collect(token)
+    except Exception as e:
+        print(f"[WARN] 成效統計收集失敗：{type(e).__name__}: {e}")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--resume", action="store_true", default=os.getenv("RESUME", "0") == "1",
+                    help="multicast：跳過上次已成功的人，失敗/未完成的批次沿用同一把 retry key（也可設 RESUME=1）")
+    ap.add_argument("--run-id", default=None,
+                    help="續跑用的這一輪識別（也可設 RUN_ID；預設 台北日期 + MESSAGE，跨日續跑時要指定同一個）")
+    args = ap.parse_args()
+
+    token = os.getenv("LINE_TOKEN")
+    if not token:
+        print("請以環境變數 LINE_TOKEN 提供 Channel access token")
         sys.exit(1)
 
+    push(token, os.environ, args.resume, args.run_id)
+
 if __name__ == "__main__":
     main()
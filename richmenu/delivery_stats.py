@@ -0,0 +1,231 @@
+# delivery_stats.py
+# 發送後的成效統計，存在本地 SQLite（STATE_DIR 裡，每個 channel 一個檔；DELIVERY_DB 可改路徑）
+#   sends           每次送出一筆：campaign / 模式 / 日期（UTC+9）/ 人數 / request id
+#   event_samples   GET /insight/message/event?requestId=（broadcast / narrowcast）每次抓到的 delivered / 開啟 / 點擊；
+#                   送出後數字會持續增加，每次取樣都留下來（時間序列），roll-up 取每個 request 最新的一筆
+#   daily_delivery  GET /message/delivery/{type}?date= 每日各類型的送達數（隔天才 ready，ready 之後不再抓）
+# 用法：LINE_TOKEN=... python richmenu/delivery_stats.py collect | backfill --days 30 | report [--since 2026-10-01]
+import os, sys, json, time, sqlite3, argparse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+import line_api
+from line_api import state_path
+
+JST = ZoneInfo("Asia/Tokyo")                 # 統計 API 的日期以 UTC+9 為準
+DELIVERY_TYPES = ("broadcast", "multicast", "push", "reply")
+EVENT_MODES = ("broadcast", "narrowcast")    # insight/message/event 只支援這兩種的 request id
+EVENT_DAYS = 14                              # 超過 14 天的訊息不再取樣（數字已經不會變）
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sends (
+    id          INTEGER PRIMARY KEY,
+    request_id  TEXT UNIQUE,
+    campaign    TEXT NOT NULL,
+    mode        TEXT NOT NULL,
+    date        TEXT NOT NULL,
+    sent_at     REAL NOT NULL,
+    recipients  INTEGER
+);
+CREATE INDEX IF NOT EXISTS sends_campaign ON sends (campaign, date);
+CREATE TABLE IF NOT EXISTS event_samples (
+    request_id   TEXT NOT NULL,
+    fetched_at   REAL NOT NULL,
+    delivered    INTEGER,
+    impressions  INTEGER,
+    clicks       INTEGER,
+    media_played INTEGER,
+    PRIMARY KEY (request_id, fetched_at)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS daily_delivery (
+    date        TEXT NOT NULL,
+    type        TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    success     INTEGER,
+    fetched_at  REAL NOT NULL,
+    PRIMARY KEY (date, type)
+) WITHOUT ROWID;
+"""
+
+def db_path(token):
+    return os.getenv("DELIVERY_DB") or state_path("delivery.sqlite", token)
+
+def connect(token):
+    path = db_path(token)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    con = sqlite3.connect(path, timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")       # 排程 daemon 寫入時，collect / report 照樣能讀
+    con.executescript(SCHEMA)
+    return con
+
+def jst_date(ts=None):
+    return f"{datetime.fromtimestamp(ts or time.time(), JST):%Y%m%d}"
+
+def record_send(token, mode, campaign, recipients=None, request_id=None):
+    """每次送出後呼叫；寫入失敗只警告，不影響發送流程"""
+    now = time.time()
+    try:
+        with closing(connect(token)) as con, con:
+            con.execute("INSERT OR IGNORE INTO sends (request_id, campaign, mode, date, sent_at, recipients) "
+                        "VALUES (?, ?, ?, ?, ?, ?)", (request_id, campaign, mode, jst_date(now), now, recipients))
+    except sqlite3.Error as e:
+        print(f"[WARN] 發送紀錄未寫入 {db_path(token)}：{e}")
+
+# ---------- 統計 API ----------
+def get_message_event(token, request_id):
+    """→ overview dict；還查不到（剛送出、或超過保存期限）回傳 None"""
+    r = line_api.get(token, "/insight/message/event", params={"requestId": request_id})
+    if r.status_code in (400, 404):
+        return None
+    if not r.ok:
+        print(f"[WARN] insight message event {request_id}: {r.status_code} {r.text}")
+        return None
+    return r.json().get("overview") or None
+
+def get_delivery(token, kind, date):
+    """→ {"status": "ready" | "unready" | "out_of_service", "success": N}；失敗回傳 None"""
+    r = line_api.get(token, f"/message/delivery/{kind}", params={"date": date})
+    if not r.ok:
+        print(f"[WARN] delivery {kind} {date}: {r.status_code} {r.text}")
+        return None
+    return r.json()
+
+def fetch_all(jobs, workers=None):
+    """jobs = [(key, callable)] 併發執行；回傳 [(key, 結果)]（寫 DB 留給呼叫端在同一個執行緒做）"""
+    workers = int(workers or os.getenv("STATS_WORKERS", "8"))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futs = [(key, line_api.submit(pool, fn)) for key, fn in jobs]
+        return [(key, f.result()) for key, f in futs]
+
+def due_requests(con, now, min_interval):
+    """14 天內送出、距上次取樣超過 min_interval 秒的 broadcast / narrowcast request id"""
+    rows = con.execute(f"""
+        SELECT s.request_id FROM sends s
+        WHERE s.request_id IS NOT NULL AND s.mode IN ({",".join("?" * len(EVENT_MODES))}) AND s.sent_at >= ?
+          AND COALESCE((SELECT MAX(fetched_at) FROM event_samples e WHERE e.request_id = s.request_id), 0) < ?""",
+        (*EVENT_MODES, now - EVENT_DAYS * 86400, now - min_interval))
+    return [r[0] for r in rows]
+
+def due_dates(con, days, today):
+    """前 days 天（不含今天）裡，每日送達數還沒 ready 的 (type, date)"""
+    ready = {(t, d) for t, d in con.execute("SELECT type, date FROM daily_delivery WHERE status = 'ready'")}
+    dates = [f"{today - timedelta(days=i):%Y%m%d}" for i in range(1, days + 1)]
+    return [(t, d) for d in dates for t in DELIVERY_TYPES if (t, d) not in ready]
+
+def collect(token, days=None, force=False, workers=None):
+    """抓所有到期的統計並寫入 DB；force = 不管上次取樣時間（backfill 用）。回傳 (取樣數, 每日數)"""
+    days = int(days or os.getenv("STATS_DAYS", "7"))
+    min_interval = 0 if force else float(os.getenv("STATS_MIN_INTERVAL", "21600"))    # 預設 6 小時取樣一次
+    now = time.time()
+    with closing(connect(token)) as con:
+        rids = due_requests(con, now, min_interval)
+        dates = due_dates(con, days, datetime.now(JST).date())
+        jobs = ([(("event", rid), lambda rid=rid: get_message_event(token, rid)) for rid in rids] +
+                [(("delivery", t, d), lambda t=t, d=d: get_delivery(token, t, d)) for t, d in dates])
+        results = fetch_all(jobs, workers) if jobs else []
+        samples = daily = 0
+        with con:
+            for key, data in results:
+                if not data:
+                    continue
+                if key[0] == "event":
+                    if data.get("delivered") is None and data.get("uniqueImpression") is None:
+                        continue                     # 還沒有數字（或人數太少，LINE 不公開）
+                    con.execute("INSERT OR REPLACE INTO event_samples VALUES (?, ?, ?, ?, ?, ?)",
+                                (key[1], now, data.get("delivered"), data.get("uniqueImpression"),
+                                 data.get("uniqueClick"), data.get("uniqueMediaPlayed")))
+                    samples += 1
+                else:
+                    con.execute("INSERT OR REPLACE INTO daily_delivery VALUES (?, ?, ?, ?, ?)",
+                                (key[2], key[1], data.get("status", "unknown"), data.get("success"), now))
+                    daily += data.get("status") == "ready"
+    print(f"[Stats] 取樣 {samples}/{len(rids)} 個 request，每日送達數 ready {daily}/{len(dates)}（{db_path(token)}）")
+    return samples, daily
+
+# ---------- Roll-up ----------
+LATEST = """
+    SELECT e.* FROM event_samples e
+    JOIN (SELECT request_id, MAX(fetched_at) AS t FROM event_samples GROUP BY request_id) m
+      ON e.request_id = m.request_id AND e.fetched_at = m.t
+"""
+
+def rollup(token, since=None):
+    """依 campaign 彙總：送出次數、人數、delivered / 開啟 / 點擊（最新樣本）、用掉的配額、每單位配額觸及"""
+    since = since or "00000000"
+    with closing(connect(token)) as con:
+        con.row_factory = sqlite3.Row
+        rows = con.execute(f"""
+            WITH latest AS ({LATEST})
+            SELECT s.campaign, COUNT(*) AS sends, MIN(s.date) AS first, MAX(s.date) AS last,
+                   GROUP_CONCAT(DISTINCT s.mode) AS modes, SUM(s.recipients) AS recipients,
+                   SUM(l.delivered) AS delivered, SUM(l.impressions) AS opened, SUM(l.clicks) AS clicked,
+                   SUM(CASE WHEN s.mode IN ('broadcast', 'narrowcast') THEN COALESCE(l.delivered, s.recipients)
+                            ELSE s.recipients END) AS quota
+            FROM sends s LEFT JOIN latest l ON l.request_id = s.request_id
+            WHERE s.date >= ?
+            GROUP BY s.campaign ORDER BY MAX(s.sent_at) DESC""", (since,)).fetchall()
+    out = []
+    for r in rows:
+        row = dict(r)
+        row["open_rate"] = round(row["opened"] / row["delivered"], 3) if row["opened"] and row["delivered"] else None
+        row["reach_per_quota"] = round(row["opened"] / row["quota"], 3) if row["opened"] and row["quota"] else None
+        out.append(row)
+    return out
+
+def daily(token, since=None):
+    """每日各類型送達數：[{"date", "broadcast", "multicast", "push", "reply"}]（未 ready 的為 None）"""
+    with closing(connect(token)) as con:
+        rows = con.execute("SELECT date, type, success FROM daily_delivery WHERE status = 'ready' AND date >= ? "
+                           "ORDER BY date", (since or "00000000",)).fetchall()
+    out = {}
+    for date, kind, success in rows:
+        out.setdefault(date, {"date": date, **dict.fromkeys(DELIVERY_TYPES)})[kind] = success
+    return list(out.values())
+
+def fmt(v):
+    return "-" if v is None else f"{v:.1%}" if isinstance(v, float) else str(v)
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("collect", help="抓到期的統計（每次發送後也會自動跑，STATS_COLLECT=0 可關閉）")
+    c.add_argument("--force", action="store_true", help="忽略 STATS_MIN_INTERVAL，全部重新取樣")
+    b = sub.add_parser("backfill", help="補抓過去 N 天的每日送達數（併發）與 14 天內所有 request 的統計")
+    b.add_argument("--days", type=int, default=30)
+    r = sub.add_parser("report", help="依 campaign 彙總 + 每日送達數")
+    r.add_argument("--since", help="YYYY-MM-DD（UTC+9）")
+    r.add_argument("--json", action="store_true")
+    for p in (c, b):
+        p.add_argument("--workers", type=int, default=None, help="同時的統計請求數（預設 STATS_WORKERS 或 8）")
+    args = ap.parse_args()
+
+    token = os.getenv("LINE_TOKEN")
+    if not token:
+        print("請以環境變數 LINE_TOKEN 提供 Channel access token")
+        sys.exit(1)
+
+    if args.cmd == "collect":
+        collect(token, force=args.force, workers=args.workers)
+    elif args.cmd == "backfill":
+        collect(token, days=args.days, force=True, workers=args.workers)
+    else:
+        since = args.since.replace("-", "") if args.since else None
+        camps, days = rollup(token, since), daily(token, since)
+        if args.json:
+            print(json.dumps({"campaigns": camps, "daily": days}, ensure_ascii=False, indent=2))
+            return
+        print(f"{'campaign':<24}{'sends':>6}{'人數':>9}{'delivered':>10}{'opened':>8}{'clicked':>8}"
+              f"{'quota':>8}{'open%':>7}{'觸及/配額':>10}")
+        for x in camps:
+            print(f"{x['campaign']:<24}{x['sends']:>6}{fmt(x['recipients']):>9}{fmt(x['delivered']):>10}"
+                  f"{fmt(x['opened']):>8}{fmt(x['clicked']):>8}{fmt(x['quota']):>8}"
+                  f"{fmt(x['open_rate']):>7}{fmt(x['reach_per_quota']):>10}")
+        days = [d for d in days if any(d[t] for t in DELIVERY_TYPES)]      # 沒有任何送達的日子不列
+        if days:
+            print(f"\n{'date':<10}" + "".join(f"{t:>11}" for t in DELIVERY_TYPES))
+            for d in days:
+                print(f"{d['date']:<10}" + "".join(f"{fmt(d[t]):>11}" for t in DELIVERY_TYPES))
+
+if __name__ == "__main__":
+    main()
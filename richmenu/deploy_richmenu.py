@@ -1,19 +1,9 @@
 # deploy_richmenu.py
-import os, json, argparse, sys
-import requests
-from PIL import Image
+import os, argparse, sys
+import reconcile, menu_image
 
-API = "https://api.line.me/v2/bot"
-API_DATA = "https://api-data.line.me/v2/bot"
-
-def must_ok(r, msg):
-    if not r.ok:
-        print(f"[ERROR] {msg}: {r.status_code} {r.text}")
-        sys.exit(1)
-
-def create_menu(token, name, chatbar, home_url, fb_url, ig_url, threads_url):
-    HJ = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
-    body = {
+def menu_body(name, chatbar, home_url, fb_url, ig_url, threads_url):
+    return {
         'size': {'width': 2500, 'height': 1686},
         'selected': True,
         'name': name,
@@ -29,52 +19,22 @@ def create_menu(token, name, chatbar, home_url, fb_url, ig_url, threads_url):
              'action': {'type': 'uri', 'label': 'Threads', 'uri': threads_url}},
         ]
     }
-    r = requests.post(f"{API}/richmenu", headers=HJ, data=json.dumps(body).encode("utf-8"))
-    must_ok(r, "create richmenu")
-    rid = r.json()["richMenuId"]
-    print("[OK] created:", rid)
-    return rid
-
-def upload_image(token, richmenu_id, image_path):
-    HB = {'Authorization': f'Bearer {token}', 'Content-Type': 'image/jpeg'}
-    w, h = Image.open(image_path).size
-    assert (w, h) == (2500, 1686), f"圖片需 2500x1686，現在是 {w}x{h}"
-    with open(image_path, "rb") as f:
-        r = requests.post(f"{API_DATA}/richmenu/{richmenu_id}/content", headers=HB, data=f.read())
-    must_ok(r, "upload image")
-    print("[OK] uploaded image to", richmenu_id)
 
-def set_default_all(token, richmenu_id):
-    H = {'Authorization': f'Bearer {token}'}
-    r = requests.post(f"{API}/user/all/richmenu/{richmenu_id}", headers=H)
-    must_ok(r, "set default(all)")
-    print("[OK] set default(all):", richmenu_id)
+def grid_body(name, chatbar, grid):
+    import menu_render                    # numpy / PIL 只在用格線規格時才載入
+    w, h = grid.get("size", (2500, 1686))
+    return {'size': {'width': w, 'height': h}, 'selected': True, 'name': name,
+            'chatBarText': chatbar, 'areas': menu_render.areas(grid)}
 
-def get_default_all(token):
-    H = {'Authorization': f'Bearer {token}'}
-    r = requests.get(f"{API}/user/all/richmenu", headers=H)
-    if r.status_code == 200:
-        rid = r.json().get("richMenuId")
-        print("[OK] current default(all):", rid)
-        return rid
-    print("[INFO] default(all): none")
-    return None
+def load_image(image_path):
+    """讀圖並檢查尺寸（只讀一次檔、只解析檔頭；超過 1MB 才重新壓縮）"""
+    return menu_image.prepare(image_path, 2500, 1686)
 
-def list_menus(token):
-    H = {'Authorization': f'Bearer {token}'}
-    r = requests.get(f"{API}/richmenu/list", headers=H)
-    must_ok(r, "list menus")
-    return r.json().get("richmenus", [])
-
-def delete_menu(token, richmenu_id):
-    H = {'Authorization': f'Bearer {token}'}
-    r = requests.delete(f"{API}/richmenu/{richmenu_id}", headers=H)
-    must_ok(r, f"delete {richmenu_id}")
-    print("[OK] deleted:", richmenu_id)
-
-def main():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument("--image", default="richmenu/line/richmenu_comp.jpg")
+    parser.add_argument("--grid", help="改用格線規格產生圖片與 areas（例如 richmenu/line/grid_comp.json）；忽略 --image 與各連結參數；label 有中文時要以環境變數 MENU_FONT（或規格的 font）指定中文字型檔，否則直接報錯")
+    parser.add_argument("--variant", help="grid 規格內的變體名稱（換季配色 / A/B 測試）")
     parser.add_argument("--name", default="劇團資訊")
     parser.add_argument("--chatbar", default="劇團資訊")
     parser.add_argument("--home", default="https://syh8316.github.io/syh8316/syh/home.html")
@@ -83,26 +43,43 @@ def main():
     parser.add_argument("--threads", default="https://www.threads.net/@syh.ot_1994")
     parser.add_argument("--delete-others", action="store_true", help="建立後刪除舊選單")
     parser.add_argument("--set-default", action="store_true", help="建立後設為全體預設")
-    args = parser.parse_args()
+    parser.add_argument("--plan", action="store_true", help="只印出與現況的差異，不做變更")
+    return parser.parse_args(argv)
 
+def deploy(token, args):
+    """一個 channel 的單一選單部署；args 同命令列參數（multi_channel.py 以 parse_args([]) 為底再覆寫）"""
+    # 宣告期望狀態 → reconcile 只做必要的操作（選單與圖都沒變就不重建）
+    if args.grid:
+        # 圖與點擊範圍出自同一份規格
+        import menu_render
+        grid = menu_render.apply_variant(menu_render.load_grid(args.grid), args.variant)
+        menu_render.check_labels(grid)
+        img_digest = reconcile.digest(menu_render.digest(grid), menu_image.MAX_BYTES)
+        body = grid_body(reconcile.tagged_name(args.name, img_digest), args.chatbar, grid)
+        image = lambda: menu_render.render_jpeg(grid)
+    else:
+        with open(args.image, "rb") as f:
+            img_digest = reconcile.digest(f.read())
+        body = menu_body(reconcile.tagged_name(args.name, img_digest), args.chatbar,
+                         args.home, args.fb, args.ig, args.threads)
+        image = lambda: load_image(args.image)
+    desired = {
+        "menus":   {"main": {"body": body, "image": image}},
+        "aliases": {},
+        "default": "main" if args.set_default else None,
+        "prune":   args.delete_others,
+    }
+    ids = reconcile.reconcile(token, desired, dry_run=args.plan)
+    print("[OK] menu:", ids.get("main"))
+    return ids
+
+def main():
+    args = parse_args()
     token = os.environ.get("LINE_TOKEN")
     if not token:
         print("請以環境變數 LINE_TOKEN 提供 Channel access token")
         sys.exit(1)
-
-    # 建立 → 上傳圖 → （選擇性）設全體預設 → （選擇性）刪舊的
-    new_id = create_menu(token, args.name, args.chatbar, args.home, args.fb, args.ig, args.threads)
-    upload_image(token, new_id, args.image)
-
-    if args.set_default:
-        set_default_all(token, new_id)
-        get_default_all(token)
-
-    if args.delete_others:
-        menus = list_menus(token)
-        for m in menus:
-            if m["richMenuId"] != new_id:
-                delete_menu(token, m["richMenuId"])
+    deploy(token, args)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,301 @@
+# follower_store.py
+# 好友 id 的本地二進位儲存：U + 32 hex → 16 bytes，排序後存成一個檔，mmap 讀取
+#   <name>.bin  排序、去重的 16-byte 紀錄（完整掃描 followers/ids 或 compact 時整檔重寫）
+#   <name>.log  follow / unfollow 增量（每筆 17 bytes：b"+" 或 b"-" + 16 bytes），讀取時與 .bin 合併
+#   <name>.json 上次完整掃描的時間與人數（決定何時再做一次一致性檢查）
+import os, re, json, mmap, time, heapq, fcntl, tempfile
+from contextlib import contextmanager
+
+REC = 16
+OP_REC = 17
+RUN_SIZE = 262144            # 外部排序每段的筆數（約 4 MB）
+ID_RE = re.compile(r"^U[0-9a-f]{32}$")
+
+def encode(uid):
+    if not ID_RE.match(uid):
+        raise ValueError(f"不是合法的 userId：{uid!r}")
+    return bytes.fromhex(uid[1:])
+
+def decode(rec):
+    return "U" + rec.hex()
+
+# ---------- 排序串流的集合運算（輸入都是遞增、不重複的 16-byte 紀錄） ----------
+def union(*streams):
+    last = None
+    for rec in heapq.merge(*streams):
+        if rec != last:
+            yield rec
+            last = rec
+
+def difference(stream, exclude):
+    """exclude 可以是 set（小名單）或另一條排序串流"""
+    if isinstance(exclude, (set, frozenset)):
+        yield from (rec for rec in stream if rec not in exclude)
+        return
+    exclude = iter(exclude)
+    ex = next(exclude, None)
+    for rec in stream:
+        while ex is not None and ex < rec:
+            ex = next(exclude, None)
+        if rec != ex:
+            yield rec
+
+def sorted_records(ids):
+    return sorted({encode(uid) for uid in ids})
+
+def _read_run(f):
+    f.seek(0)
+    while True:
+        block = f.read(REC * 4096)
+        if not block:
+            return
+        for off in range(0, len(block), REC):
+            yield block[off:off + REC]
+
+def write_sorted(path, records, run_size=RUN_SIZE):
+    """任意順序的紀錄 → 排序去重後原子寫入 path；超過 run_size 筆時分段排序再合併（記憶體固定）"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    runs, buf = [], []
+    def spill():
+        f = tempfile.TemporaryFile(dir=directory)
+        f.write(b"".join(sorted(set(buf))))
+        runs.append(f)
+        buf.clear()
+    for rec in records:
+        buf.append(rec)
+        if len(buf) >= run_size:
+            spill()
+    if runs:
+        spill()
+        stream = union(*(_read_run(f) for f in runs))
+    else:
+        stream = iter(sorted(set(buf)))
+    tmp, n = f"{path}.{os.getpid()}.tmp", 0
+    try:
+        with open(tmp, "wb") as out:
+            chunk = []
+            for rec in stream:
+                chunk.append(rec)
+                if len(chunk) >= 4096:
+                    out.write(b"".join(chunk)); n += len(chunk); chunk.clear()
+            out.write(b"".join(chunk)); n += len(chunk)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, path)
+    finally:
+        for f in runs:
+            f.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return n
+
+class FollowerStore:
+    """排序 + mmap 的好友集合；follow()/unfollow() 只追加到 .log，超過 compact_every 筆再合併回 .bin"""
+    def __init__(self, base, compact_every=None):
+        self.base = base
+        self.bin_path, self.log_path, self.meta_path = f"{base}.bin", f"{base}.log", f"{base}.json"
+        self.lock_path, self.rebuild_path = f"{base}.lock", f"{base}.rebuild.lock"
+        self.compact_every = int(compact_every or os.getenv("FOLLOWER_COMPACT_EVERY", "10000"))
+        self.mm, self.n = None, 0
+        self.adds, self.removes = set(), set()   # 相對於 .bin 的差異（已正規化）
+        self.log_ops = 0
+
+    # ---------- 開檔 / 鎖 ----------
+    @contextmanager
+    def locked(self):
+        """跨 process 的互斥（webhook 寫 log 與每日推播 rescan/compact 可能同時發生）"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.lock_path)), exist_ok=True)
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @contextmanager
+    def rebuilding(self, wait=True):
+        """重建 .bin（compact / rescan）的互斥，整個「取 log 位置 → 寫新檔 → 換檔」期間持有；
+           兩個 process 同時重建時，後到的會在前一個換檔（截斷 log）之後才取位置，不會用到過期的 offset。
+           與 locked() 分開：重建期間 webhook 仍可追加 log。wait=False 時拿不到就 yield False
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.rebuild_path)), exist_ok=True)
+        with open(self.rebuild_path, "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def open(self, log_limit=None):
+        """載入 .bin（mmap）與 .log；log_limit = 只套用 log 的前幾個 bytes（compact 用）"""
+        self.close()
+        with self.locked():              # .bin 與 .log 在 _swap 時一起換，讀的時候也要一起讀
+            try:
+                with open(self.bin_path, "rb") as f:
+                    size = os.fstat(f.fileno()).st_size
+                    if size:
+                        self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.n = size // REC
+            except FileNotFoundError:
+                self.n = 0
+            try:
+                with open(self.log_path, "rb") as f:
+                    data = f.read() if log_limit is None else f.read(log_limit)
+            except FileNotFoundError:
+                data = b""
+        self.adds, self.removes, self.log_ops = set(), set(), 0
+        for off in range(0, len(data) - len(data) % OP_REC, OP_REC):   # 最後不完整的一筆（寫到一半）略過
+            self._apply(data[off:off + 1], data[off + 1:off + OP_REC])
+        return self
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+    # ---------- 查詢 ----------
+    def _in_base(self, rec):
+        lo, hi, mm = 0, self.n, self.mm
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if mm[mid * REC:(mid + 1) * REC] < rec:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo < self.n and mm[lo * REC:(lo + 1) * REC] == rec
+
+    def __contains__(self, uid):
+        rec = encode(uid) if isinstance(uid, str) else uid
+        if rec in self.adds:
+            return True
+        if rec in self.removes:
+            return False
+        return self._in_base(rec)
+
+    def __len__(self):
+        return self.n + len(self.adds) - len(self.removes)
+
+    def _base_records(self):
+        mm, step = self.mm, REC * 4096
+        for start in range(0, self.n * REC, step):
+            block = mm[start:start + step]
+            for off in range(0, len(block), REC):
+                yield block[off:off + REC]
+
+    def records(self):
+        """目前的完整集合（排序後的 16-byte 紀錄串流）"""
+        base = self._base_records()
+        if self.removes:
+            base = difference(base, self.removes)
+        return union(base, iter(sorted(self.adds))) if self.adds else base
+
+    def __iter__(self):
+        return (decode(rec) for rec in self.records())
+
+    def targets(self, include=(), exclude=()):
+        """(好友 ∪ include) − exclude，依序 yield userId；include/exclude 為 userId 清單"""
+        stream = self.records()
+        if include:
+            stream = union(stream, iter(sorted_records(include)))
+        if exclude:
+            stream = difference(stream, set(sorted_records(exclude)))
+        return (decode(rec) for rec in stream)
+
+    def count_targets(self, include=(), exclude=()):
+        """targets() 的人數，只靠 membership 查詢算出，不必走過整個集合"""
+        inc, exc = set(include), set(exclude)
+        return (len(self) + sum(1 for uid in inc - exc if uid not in self)
+                - sum(1 for uid in exc if uid in self))
+
+    # ---------- 增量維護 ----------
+    def _apply(self, op, rec):
+        self.log_ops += 1
+        if op == b"+":
+            self.removes.discard(rec)
+            if not self._in_base(rec):
+                self.adds.add(rec)
+        else:
+            self.adds.discard(rec)
+            if self._in_base(rec):
+                self.removes.add(rec)
+
+    def _log(self, op, uid):
+        rec = encode(uid)
+        with self.locked(), open(self.log_path, "ab") as f:
+            f.write(op + rec)
+        self._apply(op, rec)
+        return self.log_ops >= self.compact_every      # True = 該 compact 了
+
+    def follow(self, uid):
+        return self._log(b"+", uid)
+
+    def unfollow(self, uid):
+        return self._log(b"-", uid)
+
+    def _log_size(self):
+        with self.locked():
+            size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        return size - size % OP_REC
+
+    def _swap(self, new_bin, merged, meta=None):
+        """換上新的 .bin，.log 只留下前 merged bytes 之後（建新檔期間其他 process 追加）的部分"""
+        with self.locked():
+            try:
+                with open(self.log_path, "rb") as f:
+                    f.seek(merged)
+                    tail = f.read()
+            except FileNotFoundError:
+                tail = b""
+            os.replace(new_bin, self.bin_path)
+            with open(self.log_path, "wb") as f:
+                f.write(tail[:len(tail) - len(tail) % OP_REC])
+            if meta is not None:
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump(meta, f)
+
+    def _staging(self):
+        return f"{self.bin_path}.{os.getpid()}.new"
+
+    def compact(self):
+        """把 .log 合併回 .bin；合併期間只在開頭與換檔時短暫持有鎖，webhook 可以繼續寫 log。
+           別的 process 正在重建（例如每日推播的 rescan）就略過，log 留給下次
+        """
+        with self.rebuilding(wait=False) as ok:
+            if not ok:
+                print("[Followers] 另一個 process 正在重建 store，這次不 compact")
+                return self.open()
+            merged = self._log_size()
+            self.open(log_limit=merged)
+            if self.log_ops:
+                write_sorted(self._staging(), self.records())
+                self._swap(self._staging(), merged)
+        return self.open()
+
+    # ---------- 完整掃描 ----------
+    def meta(self):
+        try:
+            with open(self.meta_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def stale(self, max_age):
+        """距離上次完整掃描超過 max_age 秒（或從沒掃過）"""
+        return time.time() - self.meta().get("scanned_at", 0) > max_age
+
+    def rescan(self, ids):
+        """用完整的 followers/ids 重建 .bin；掃描期間 webhook 追加的 log 會保留並重新套用"""
+        with self.rebuilding():
+            merged = self._log_size()
+            before = len(self.open()) if os.path.exists(self.meta_path) else None
+            n = write_sorted(self._staging(), (encode(uid) for uid in ids))
+            self._swap(self._staging(), merged, {"scanned_at": time.time(), "count": n})
+        self.open()
+        drift = "" if before is None else f"（本地 {before}，差 {n - before:+d}）"
+        print(f"[Followers] 完整掃描 {n} 人{drift}")
+        return self
@@ -0,0 +1,393 @@
+# line_api.py
+# 三支腳本共用的 LINE API client：每個 host 一個 keep-alive 連線池、統一的重試/退避、X-Line-Retry-Key
+import os, sys, json, time, uuid, random, hashlib, threading, contextvars
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import line_http, line_metrics
+
+# LINE_API_BASE / LINE_API_DATA_BASE 可指向本地替身（line_stub.py）做離線測試
+API = os.getenv("LINE_API_BASE", "https://api.line.me") + "/v2/bot"
+API_DATA = os.getenv("LINE_API_DATA_BASE", "https://api-data.line.me") + "/v2/bot"
+
+STATE_DIR = os.getenv("STATE_DIR", os.path.expanduser("~/.cache/line-richmenu"))
+
+# HTTP 傳輸層：預設用標準庫的 line_http（冷啟動快、不用裝套件）；HTTP_CLIENT=requests 時改用 requests
+HTTP_CLIENT = os.getenv("HTTP_CLIENT", "stdlib")
+if HTTP_CLIENT == "requests":
+    import requests
+    from requests.adapters import HTTPAdapter
+    ConnError, RequestError = requests.ConnectionError, requests.RequestException
+else:
+    ConnError, RequestError = line_http.ConnectionError, line_http.RequestException
+
+# 支援 X-Line-Retry-Key 的 endpoint（其他 endpoint 帶了會被拒絕）
+RETRY_KEY_PATHS = ("/message/push", "/message/multicast", "/message/narrowcast", "/message/broadcast")
+
+# LINE 各 endpoint 的速率上限（requests / 秒，per channel）
+RATE_LIMITS = {"multicast": 200, "push": 2000, "bulk": 3, "default": 2000}   # bulk = richmenu bulk link/unlink
+
+def state_path(name, token=None):
+    """本地狀態檔路徑；有 token 時依 token 雜湊分開存（不同 channel 不互相覆蓋）"""
+    if token:
+        name = f"{hashlib.sha256(token.encode()).hexdigest()[:12]}_{name}"
+    return os.path.join(STATE_DIR, name)
+
+def accepted(r):
+    """2xx，或 409 + X-Line-Accepted-Request-Id（同一個 retry key 已被 LINE 收過）都算成功"""
+    return r.ok or (r.status_code == 409 and "X-Line-Accepted-Request-Id" in r.headers)
+
+def must_ok(r, what):
+    if not accepted(r):
+        print(f"[ERROR] {what}: {r.status_code} {r.text}")
+        sys.exit(1)
+    else:
+        rid = r.headers.get("X-Line-Request-Id", "-")
+        print(f"[OK] {what} (X-Line-Request-Id: {rid})")
+
+def submit(pool, fn, *args, **kwargs):
+    """pool.submit，但工作執行緒沿用呼叫端的 contextvars（例如 multi_channel 的 channel 名稱，log 前綴用）"""
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+def retry_after(r, attempt):
+    """429/5xx 的等待秒數：有 Retry-After 就照辦，否則指數退避（加一點抖動）"""
+    try:
+        return max(0.0, float(r.headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return min(60.0, 2 ** attempt) * random.uniform(0.8, 1.2)
+
+# ---------- Rate limiting ----------
+class TokenBucket:
+    """簡易 token bucket：rate=每秒補充量、burst=桶容量；pause() 用於 429 Retry-After"""
+    def __init__(self, rate, burst=None):
+        self.rate  = float(rate)
+        self.burst = float(burst or rate)
+        self.tokens = self.burst
+        self.t = time.monotonic()
+        self.hold_until = 0.0
+        self.lock = threading.Lock()
+
+    def pause(self, seconds):
+        with self.lock:
+            self.hold_until = max(self.hold_until, time.monotonic() + seconds)
+            self.tokens, self.t = 0.0, self.hold_until
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.hold_until:
+                    wait = self.hold_until - now
+                else:
+                    self.tokens = min(self.burst, self.tokens + (now - self.t) * self.rate)
+                    self.t = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class AdaptiveLimit:
+    """同時進行中的請求上限：遇到 429 減半，連續成功再慢慢加回（AIMD）"""
+    def __init__(self, start, maximum):
+        self.limit, self.maximum = max(1, start), max(1, maximum)
+        self.inflight, self.streak = 0, 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.inflight >= self.limit:
+                self.cond.wait()
+            self.inflight += 1
+
+    def release(self, throttled=False):
+        with self.cond:
+            self.inflight -= 1
+            if throttled:
+                self.limit, self.streak = max(1, self.limit // 2), 0
+                print(f"[Throttle] 429 → 併發降為 {self.limit}")
+            else:
+                self.streak += 1
+                if self.streak >= self.limit and self.limit < self.maximum:
+                    self.limit, self.streak = self.limit + 1, 0
+            self.cond.notify_all()
+
+# ---------- Client ----------
+class LineClient:
+    """一個 channel token 一個 client：
+       - 每個 host（api.line.me / api-data.line.me）一個 Session，連線池內 keep-alive 重用
+       - 429 / 5xx / 連線錯誤依 Retry-After 或指數退避重試
+       - 發訊息的 POST 自動帶 X-Line-Retry-Key，重試沿用同一把，LINE 會去重
+       - 沒有 retry key 的 POST（建立選單等）只在 429 時重試，避免 5xx 後重做造成重複
+    """
+    def __init__(self, token, pool_size=None, max_retries=None, timeout=None):
+        self.token = token
+        self.pool_size   = int(pool_size or os.getenv("HTTP_POOL_SIZE", "16"))
+        self.max_retries = int(max_retries if max_retries is not None else os.getenv("HTTP_MAX_RETRIES", "3"))
+        self.timeout     = float(timeout or os.getenv("HTTP_TIMEOUT", "30"))
+        self.sessions, self.buckets = {}, {}
+        self.lock = threading.Lock()
+
+    def session(self, host):
+        with self.lock:
+            s = self.sessions.get(host)
+            if s is None:
+                if HTTP_CLIENT == "requests":
+                    s = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    s.mount("https://", adapter)
+                    s.mount("http://", adapter)
+                else:
+                    s = line_http.Session(self.pool_size)
+                s.headers["Authorization"] = f"Bearer {self.token}"
+                self.sessions[host] = s
+            return s
+
+    def bucket(self, endpoint="default"):
+        """這個 channel 某個 endpoint 的速率桶（同一 channel 的併發發送共用）"""
+        with self.lock:
+            b = self.buckets.get(endpoint)
+            if b is None:
+                rate = float(os.getenv(f"{endpoint.upper()}_RPS", RATE_LIMITS.get(endpoint, RATE_LIMITS["default"])))
+                b = self.buckets[endpoint] = TokenBucket(rate)
+            return b
+
+    def request(self, method, url, json_body=None, data=None, params=None, headers=None,
+                retry_key=None, max_retries=None, files=None):
+        """files：multipart 上傳（例如 audienceGroup/upload/byFile），格式 {名稱: (檔名, bytes, content type)}"""
+        if url.startswith("/"):
+            url = API + url
+        parts = urlsplit(url)
+        headers = dict(headers or {})
+        if json_body is not None:
+            data = json.dumps(json_body).encode("utf-8")
+            headers.setdefault("Content-Type", "application/json")
+        if method == "POST" and retry_key is None and parts.path.endswith(RETRY_KEY_PATHS):
+            retry_key = str(uuid.uuid4())
+        if retry_key:
+            headers["X-Line-Retry-Key"] = retry_key
+        max_retries = self.max_retries if max_retries is None else max_retries
+        idempotent = method != "POST" or bool(retry_key)
+
+        s = self.session(parts.netloc)
+        label = line_metrics.endpoint_label(method, parts.path)
+        sent = len(data) if data else 0
+        for attempt in range(max_retries + 1):
+            t = time.perf_counter()
+            try:
+                r = s.request(method, url, data=data, params=params, headers=headers, files=files,
+                              timeout=self.timeout)
+            except ConnError:
+                line_metrics.observe(label, "error", time.perf_counter() - t, sent)
+                if attempt >= max_retries or not idempotent:
+                    raise
+                line_metrics.retry(label)
+                time.sleep(min(60.0, 2 ** attempt))
+                continue
+            line_metrics.observe(label, r.status_code, time.perf_counter() - t, sent)
+            retryable = r.status_code == 429 or (r.status_code >= 500 and idempotent)
+            if not retryable or attempt >= max_retries:
+                return r
+            line_metrics.retry(label)
+            wait = retry_after(r, attempt)
+            print(f"[Retry] {method} {parts.path}: {r.status_code}，{wait:.1f}s 後重試（{attempt+1}/{max_retries}）")
+            time.sleep(wait)
+        return r
+
+    def get(self, url, **kw):
+        return self.request("GET", url, **kw)
+
+    def post(self, url, **kw):
+        return self.request("POST", url, **kw)
+
+    def put(self, url, **kw):
+        return self.request("PUT", url, **kw)
+
+    def delete(self, url, **kw):
+        return self.request("DELETE", url, **kw)
+
+_clients, _clients_lock = {}, threading.Lock()
+
+def client(token):
+    """同一個 token 共用同一個 client（連線池、速率桶）"""
+    with _clients_lock:
+        c = _clients.get(token)
+        if c is None:
+            c = _clients[token] = LineClient(token)
+        return c
+
+def get(token, url, **kw):
+    return client(token).get(url, **kw)
+
+def post(token, url, **kw):
+    return client(token).post(url, **kw)
+
+def put(token, url, **kw):
+    return client(token).put(url, **kw)
+
+def delete(token, url, **kw):
+    return client(token).delete(url, **kw)
+
+# ---------- Send journal ----------
+def chunk_key(chunk):
+    """以內容雜湊識別批次：同一份名單 → 同一把 retry key"""
+    return hashlib.sha256("\n".join(chunk).encode("utf-8")).hexdigest()[:16]
+
+class Journal:
+    """JSONL 進度檔：每批送出前先寫一行 {key, n, ids, retry_key, ok: null}，結束時再寫 {key, ok, info}。
+       續跑（load 之後）以 userId 為單位：
+       - acked：已成功批次裡的人，remaining() 直接略過。好友增減讓批次邊界移動也不會重送
+       - pending()：上次沒確認成功（失敗、或送出途中掛掉）的批次，照原名單、原 retry key 重送，
+         LINE 已收過的會回 409 而不會重發
+       續跑時要把所有名單載入記憶體（O(人數)）；一般執行只記批次 key，記憶體與批次大小有關
+    """
+    def __init__(self, path):
+        self.path, self.lock = path, threading.Lock()
+        self.done, self.keys, self.logged = set(), {}, set()   # 成功的批次 key、key → retry key、已寫過名單的 key
+        self.acked, self.batches = set(), {}                    # load()：已成功的 userId、未確認的批次 key → 名單
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def load(self):
+        ids = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue        # 寫到一半被中斷的最後一行
+                    if rec.get("ids"):
+                        ids[rec["key"]] = rec["ids"]
+                        self.logged.add(rec["key"])
+                    if rec.get("retry_key"):
+                        self.keys[rec["key"]] = rec["retry_key"]
+                    if rec.get("ok"):
+                        self.done.add(rec["key"])
+        except FileNotFoundError:
+            pass
+        self.acked = {uid for key in self.done for uid in ids.get(key, ())}
+        self.batches = {key: chunk for key, chunk in ids.items() if key not in self.done}
+        print(f"[Journal] {self.path}: 已完成 {len(self.done)} 批 / {len(self.acked)} 人，未確認 {len(self.batches)} 批")
+        return self
+
+    def reset(self):
+        open(self.path, "w").close()
+        return self
+
+    def pending(self):
+        """上次沒確認成功的批次（原名單，重送時沿用同一把 retry key）"""
+        return list(self.batches.values())
+
+    def remaining(self, ids):
+        """略過已成功或在 pending() 裡的 userId"""
+        skip = self.acked.union(*self.batches.values())
+        return (uid for uid in ids if uid not in skip) if skip else ids
+
+    def _write(self, chunk, ok, info, retry_key=None):
+        key = chunk_key(chunk)
+        rec = {"key": key, "n": len(chunk), "ok": ok, "info": info,
+               "retry_key": retry_key or self.keys.get(key), "at": int(time.time())}
+        with self.lock, open(self.path, "a", encoding="utf-8") as f:
+            if key not in self.logged:  # 名單每批只寫一次（送出前那一行；沒有 retry key 的用法則是結果那一行）
+                rec["ids"] = chunk
+                self.logged.add(key)
+            f.write(json.dumps(rec) + "\n")
+            f.flush()
+            os.fsync(f.fileno())        # 先落地再送出，才能保證續跑時拿得到同一把 key
+            if ok:
+                self.done.add(key)
+        return rec
+
+    def retry_key(self, chunk):
+        """這一批的 X-Line-Retry-Key：journal 裡有就沿用，沒有就產生並先記下"""
+        key = chunk_key(chunk)
+        with self.lock:
+            rk = self.keys.get(key)
+            if rk:
+                return rk
+            rk = self.keys[key] = str(uuid.uuid4())
+        self._write(chunk, None, "sending", rk)
+        return rk
+
+    def record(self, chunk, ok, info):
+        self._write(chunk, ok, info)
+
+# ---------- Concurrent dispatcher ----------
+def dispatch(chunks, send_one, what, endpoint="default", workers=None, max_retries=None, budget=None,
+             on_result=None, bucket=None, retry_key=None):
+    """把 chunks 併發送出；send_one(chunk, retry_key) 回傳 response（send_one 本身不要再重試）。
+       429/5xx/連線錯誤會以同一個 retry key 重試；單一 chunk 失敗只記錄，不中斷其他 chunk。
+       budget（例如 QuotaLedger）：每批送出前 reserve(len)，不夠就停止後續批次；失敗的批次 refund。
+       on_result(idx, chunk, ok, info)：每批結束時呼叫（info = X-Line-Request-Id 或失敗原因），可用來寫 journal。
+       bucket：速率桶，通常傳 client(token).bucket(endpoint)，沒給就依 endpoint 新建一個。
+       retry_key(chunk)：決定這一批的 X-Line-Retry-Key（例如 Journal.retry_key，續跑時沿用）；沒給就每批新產生。
+       回傳失敗清單 [(index, chunk, 原因), ...]
+    """
+    workers     = workers or int(os.getenv("PUSH_WORKERS", "8"))
+    max_retries = max_retries if max_retries is not None else int(os.getenv("PUSH_MAX_RETRIES", "5"))
+    if bucket is None:
+        bucket = TokenBucket(float(os.getenv(f"{endpoint.upper()}_RPS", RATE_LIMITS.get(endpoint, RATE_LIMITS["default"]))))
+    limit  = AdaptiveLimit(workers, workers)
+    failed, done = [], [0, 0]          # [chunks, users]
+    lock = threading.Lock()
+
+    def send_chunk(idx, chunk, key):
+        """回傳 (成功與否, request id 或失敗原因, 是否遇到 429)"""
+        reason, throttled = None, False
+        for attempt in range(max_retries + 1):
+            if attempt:
+                time.sleep(wait)
+            bucket.acquire()
+            try:
+                r = send_one(chunk, key)
+            except RequestError as e:
+                reason, wait = f"{type(e).__name__}: {e}", min(60.0, 2 ** attempt)
+                continue
+            if accepted(r):
+                rid = r.headers.get("X-Line-Request-Id", "-")
+                print(f"[OK] {what} #{idx} ({len(chunk)}) (X-Line-Request-Id: {rid})")
+                return True, rid, throttled
+            reason = f"{r.status_code} {r.text}"
+            if r.status_code != 429 and r.status_code < 500:
+                break                   # 其他 4xx 重試也沒用
+            wait = retry_after(r, attempt)
+            if r.status_code == 429:
+                throttled = True
+                bucket.pause(wait)
+            if attempt < max_retries:
+                if r.request is not None:
+                    line_metrics.retry(line_metrics.endpoint_label(r.request.method, urlsplit(r.request.url).path))
+                print(f"[Retry] {what} #{idx}: {r.status_code}，{wait:.1f}s 後重試（{attempt+1}/{max_retries}）")
+        return False, reason, throttled
+
+    def run(idx, chunk):
+        ok, info, throttled = False, None, False
+        try:
+            key = retry_key(chunk) if retry_key else str(uuid.uuid4())
+            ok, info, throttled = send_chunk(idx, chunk, key)   # info：成功時是 request id，失敗時是原因
+        except Exception as e:          # 不讓單一 chunk 的例外消失在 thread pool 裡
+            info = f"{type(e).__name__}: {e}"
+        finally:
+            limit.release(throttled)
+        if not ok and budget:
+            budget.refund(len(chunk))
+        with lock:
+            if ok:
+                done[0] += 1; done[1] += len(chunk)
+            else:
+                print(f"[ERROR] {what} #{idx} ({len(chunk)}): {info}")
+                failed.append((idx, chunk, info))
+        if on_result:
+            on_result(idx, chunk, ok, info)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for idx, chunk in enumerate(chunks):
+            if budget and not budget.reserve(len(chunk)):
+                print(f"[Skip] 配額保護：從第 #{idx} 批起停止發送")
+                break
+            limit.acquire()             # 控制同時在途的 chunk 數（也是背壓）
+            submit(pool, run, idx, chunk)
+
+    line_metrics.throughput(what, done[1], time.perf_counter() - t0)
+    print(f"[Done] {what}: 成功 {done[0]} 批 / {done[1]} 人，失敗 {len(failed)} 批")
+    return failed
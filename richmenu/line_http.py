@@ -0,0 +1,133 @@
+# line_http.py
+# 只用標準庫（http.client）的 keep-alive HTTP client，給 line_api 當預設傳輸層
+# 只做 LINE API 用得到的部分：連線池、query string、bytes / JSON / multipart body、逾時；不跟隨轉址、不解壓縮
+# 好處是冷啟動不必 import requests（省下約 80 ms），cron 環境也不用 pip install
+import json, ssl, uuid, threading
+import http.client
+from urllib.parse import urlsplit, urlencode
+
+_ssl = None
+_ssl_lock = threading.Lock()
+
+class RequestException(OSError):
+    """傳輸層錯誤的共同父類別（對應 requests.RequestException）"""
+
+class ConnectionError(RequestException):
+    """連不上、連線中斷、逾時"""
+
+def ssl_context():
+    global _ssl
+    with _ssl_lock:
+        if _ssl is None:
+            _ssl = ssl.create_default_context()
+        return _ssl
+
+class PreparedRequest:
+    def __init__(self, method, url):
+        self.method, self.url = method, url
+
+class Response:
+    """requests.Response 的子集：status_code / ok / headers / content / text / json() / request"""
+    def __init__(self, status, reason, headers, content, request):
+        self.status_code, self.reason, self.headers = status, reason, headers
+        self.content, self.request, self.url = content, request, request.url
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", "replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+def multipart(fields, files):
+    """fields = {名稱: 字串}，files = {名稱: (檔名, bytes, content type)} → (body, Content-Type)"""
+    boundary = uuid.uuid4().hex
+    out = []
+    for name, value in (fields or {}).items():
+        out.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode("utf-8"))
+    for name, (filename, data, ctype) in files.items():
+        data = data if isinstance(data, bytes) else data.read()
+        out.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                   f'Content-Type: {ctype}\r\n\r\n'.encode("utf-8") + data + b"\r\n")
+    out.append(f"--{boundary}--\r\n".encode("ascii"))
+    return b"".join(out), f"multipart/form-data; boundary={boundary}"
+
+class Session:
+    """一個 host 一個 Session；閒置連線留在池裡（最多 pool_size 條），併發時各執行緒各拿一條"""
+    def __init__(self, pool_size=16):
+        self.headers = {}
+        self.pool_size = pool_size
+        self.idle = {}                       # (scheme, netloc) → [HTTPConnection, ...]
+        self.lock = threading.Lock()
+
+    def _connect(self, scheme, netloc, timeout):
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=timeout, context=ssl_context())
+        return http.client.HTTPConnection(netloc, timeout=timeout)
+
+    def _take(self, key):
+        with self.lock:
+            conns = self.idle.get(key)
+            return conns.pop() if conns else None
+
+    def _give(self, key, conn):
+        with self.lock:
+            conns = self.idle.setdefault(key, [])
+            if len(conns) < self.pool_size:
+                conns.append(conn)
+                return
+        conn.close()
+
+    def request(self, method, url, data=None, params=None, headers=None, files=None, timeout=30):
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        query = "&".join(q for q in (parts.query, urlencode(params) if params else "") if q)
+        if query:
+            path += "?" + query
+        hdrs = {**self.headers, **(headers or {})}
+        if files:
+            data, hdrs["Content-Type"] = multipart(data, files)
+        elif isinstance(data, dict):
+            data = urlencode(data).encode("ascii")
+            hdrs.setdefault("Content-Type", "application/x-www-form-urlencoded")
+        elif isinstance(data, str):
+            data = data.encode("utf-8")
+        hdrs["Content-Length"] = str(len(data) if data else 0)
+        key = (parts.scheme, parts.netloc)
+
+        for attempt in (0, 1):
+            conn = self._take(key)
+            reused = conn is not None
+            if conn is None:
+                conn = self._connect(parts.scheme, parts.netloc, timeout)
+            else:
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+            try:
+                conn.request(method, path, body=data, headers=hdrs)
+                resp = conn.getresponse()
+                content = resp.read()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                # 池裡的閒置連線可能已被伺服器關掉：換一條新的重送一次（請求根本沒被處理）
+                if reused and attempt == 0 and isinstance(e, (http.client.RemoteDisconnected,
+                                                              ConnectionResetError, BrokenPipeError)):
+                    continue
+                raise ConnectionError(f"{method} {url}: {type(e).__name__}: {e}") from e
+            if resp.will_close:
+                conn.close()
+            else:
+                self._give(key, conn)
+            return Response(resp.status, resp.reason, resp.headers, content, PreparedRequest(method, url))
+
+    def close(self):
+        with self.lock:
+            conns = [c for cs in self.idle.values() for c in cs]
+            self.idle.clear()
+        for c in conns:
+            c.close()
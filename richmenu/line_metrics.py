@@ -0,0 +1,178 @@
+# line_metrics.py
+# 每個 LINE API 呼叫的延遲/狀態/送出 bytes 記錄；程式結束時寫出 JSON 摘要 + Prometheus textfile
+import os, re, sys, json, math, time, atexit, random, threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+METRICS_DIR = os.getenv("METRICS_DIR")          # 預設放在 STATE_DIR/metrics
+ENABLED     = os.getenv("METRICS", "1") != "0"
+SAMPLES     = int(os.getenv("METRICS_SAMPLES", "10000"))   # 每個 endpoint 最多留幾筆延遲算百分位（超過改成 reservoir 抽樣）
+
+_lock = threading.Lock()
+_rng = random.Random()
+_stats = {}                 # label → {"lat": [≤ SAMPLES 筆], "max", "count", "errors", "retries", "bytes"}
+_throughput = {}            # what → {"users", "seconds"}
+_started = time.time()
+_t0 = time.monotonic()
+
+# 路徑中的 id 換成樣板，才能依 endpoint 彙總
+_ID_PATTERNS = [
+    (re.compile(r"richmenu-[0-9a-f]+"), "{richMenuId}"),
+    (re.compile(r"U[0-9a-f]{32}"), "{userId}"),
+    (re.compile(r"(/richmenu/alias/)(?!list$)[^/]+$"), r"\1{aliasId}"),
+    (re.compile(r"(/audienceGroup/)\d+"), r"\1{audienceGroupId}"),
+]
+
+def endpoint_label(method, path):
+    path = re.sub(r"^/v2/bot", "", path)
+    for pat, rep in _ID_PATTERNS:
+        path = pat.sub(rep, path)
+    return f"{method} {path}"
+
+def _slot(label):
+    s = _stats.get(label)
+    if s is None:
+        s = _stats[label] = {"lat": [], "max": 0.0, "count": 0, "errors": 0, "retries": 0, "bytes": 0}
+    return s
+
+def observe(label, status, seconds, bytes_sent=0, retries=0):
+    """記一筆：status 是 HTTP 狀態碼（或 'ok'/'error'）
+       延遲樣本固定上限（reservoir 抽樣），常駐的 webhook / 排程 process 記憶體不會一直長
+    """
+    with _lock:
+        s = _slot(label)
+        s["count"] += 1
+        s["max"] = max(s["max"], seconds)
+        if len(s["lat"]) < SAMPLES:
+            s["lat"].append(seconds)
+        else:
+            j = _rng.randrange(s["count"])
+            if j < SAMPLES:
+                s["lat"][j] = seconds
+        s["retries"] += retries
+        s["bytes"] += bytes_sent
+        if status == "error" or (isinstance(status, int) and status >= 400):
+            s["errors"] += 1
+
+def retry(label):
+    with _lock:
+        _slot(label)["retries"] += 1
+
+def throughput(what, users, seconds):
+    """例如 multicast 整批發送：users 人 / seconds 秒"""
+    with _lock:
+        t = _throughput.setdefault(what, {"users": 0, "seconds": 0.0})
+        t["users"] += users
+        t["seconds"] += seconds
+
+@contextmanager
+def stage(label):
+    """非 HTTP 的耗時階段（例如圖片處理）"""
+    t = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        observe(label, status, time.perf_counter() - t)
+
+def _pct(sorted_vals, p):
+    """nearest-rank 百分位"""
+    if not sorted_vals:
+        return 0.0
+    k = math.ceil(p / 100 * len(sorted_vals)) - 1
+    return sorted_vals[max(0, min(len(sorted_vals) - 1, k))]
+
+def summary():
+    with _lock:
+        endpoints = {}
+        for label, s in sorted(_stats.items()):
+            lat = sorted(s["lat"])
+            endpoints[label] = {
+                "count": s["count"], "errors": s["errors"], "retries": s["retries"], "bytes_sent": s["bytes"],
+                "p50_ms": round(_pct(lat, 50) * 1000, 2), "p95_ms": round(_pct(lat, 95) * 1000, 2),
+                "p99_ms": round(_pct(lat, 99) * 1000, 2), "max_ms": round(s["max"] * 1000, 2),
+            }
+        tput = {w: {**t, "users_per_s": round(t["users"] / t["seconds"], 2) if t["seconds"] else 0.0}
+                for w, t in _throughput.items()}
+    return {"run": run_name(), "started": datetime.fromtimestamp(_started, timezone.utc).isoformat(),
+            "wall_seconds": round(time.monotonic() - _t0, 3), "endpoints": endpoints, "throughput": tput}
+
+def run_name():
+    return os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0] or "python"
+
+def _esc(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"')
+
+def prometheus(s):
+    script = _esc(s["run"])
+    out = []
+    series = [("line_api_requests_total", "count"), ("line_api_errors_total", "errors"),
+              ("line_api_retries_total", "retries"), ("line_api_bytes_sent_total", "bytes_sent")]
+    for name, key in series:
+        out.append(f"# TYPE {name} counter")
+        for label, e in s["endpoints"].items():
+            out.append(f'{name}{{script="{script}",endpoint="{_esc(label)}"}} {e[key]}')
+    out.append("# TYPE line_api_latency_seconds summary")
+    for label, e in s["endpoints"].items():
+        for q, key in (("0.5", "p50_ms"), ("0.95", "p95_ms"), ("0.99", "p99_ms")):
+            out.append(f'line_api_latency_seconds{{script="{script}",endpoint="{_esc(label)}",quantile="{q}"}} {e[key] / 1000:.6f}')
+    out.append("# TYPE line_send_users_per_second gauge")
+    for what, t in s["throughput"].items():
+        out.append(f'line_send_users_per_second{{script="{script}",what="{_esc(what)}"}} {t["users_per_s"]}')
+    out.append("# TYPE line_run_wall_seconds gauge")
+    out.append(f'line_run_wall_seconds{{script="{script}"}} {s["wall_seconds"]}')
+    out.append("# TYPE line_run_timestamp_seconds gauge")
+    out.append(f'line_run_timestamp_seconds{{script="{script}"}} {int(_started)}')
+    return "\n".join(out) + "\n"
+
+def _atomic_write(path, text):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)      # textfile collector 不會讀到寫一半的檔
+
+def reset():
+    """清空統計、重新起算；常駐 process 每寫一次摘要就 reset，下一份只涵蓋之後的請求"""
+    global _started, _t0
+    with _lock:
+        _stats.clear()
+        _throughput.clear()
+        _started, _t0 = time.time(), time.monotonic()
+
+def write_summary(directory=None, reset_after=False):
+    """寫出 <script>-<UTC時間>.json（歷史）與 <script>.prom（最新一次，給 node_exporter textfile collector）
+       reset_after：寫完清空（push_scheduler 每次觸發寫一份，而不是從啟動累計）
+    """
+    if not _stats and not _throughput:
+        return None
+    if not directory and not METRICS_DIR:
+        from line_api import STATE_DIR
+        directory = os.path.join(STATE_DIR, "metrics")
+    directory = directory or METRICS_DIR
+    s = summary()
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.fromtimestamp(_started, timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    json_path = os.path.join(directory, f"{s['run']}-{stamp}.json")
+    _atomic_write(json_path, json.dumps(s, ensure_ascii=False, indent=2))
+    _atomic_write(os.path.join(directory, f"{s['run']}.prom"), prometheus(s))
+    print(f"[Metrics] {len(s['endpoints'])} endpoints, wall={s['wall_seconds']}s → {json_path}")
+    for label, e in s["endpoints"].items():
+        print(f"  {label}: n={e['count']} err={e['errors']} retry={e['retries']} "
+              f"p50={e['p50_ms']}ms p95={e['p95_ms']}ms p99={e['p99_ms']}ms")
+    for what, t in s["throughput"].items():
+        print(f"  {what}: {t['users']} users in {t['seconds']:.2f}s = {t['users_per_s']} users/s")
+    if reset_after:
+        reset()
+    return json_path
+
+def _at_exit():
+    try:
+        write_summary()
+    except OSError as e:
+        print(f"[WARN] metrics not written: {e}")
+
+if ENABLED:
+    atexit.register(_at_exit)
@@ -0,0 +1,480 @@
+# line_stub.py
+# 本地 LINE Messaging API 替身：只實作這個 repo 用到的 endpoint，可設定延遲、速率上限、注入 429/500
+# 用法：python richmenu/line_stub.py --port 8080 --followers 100000 --latency 30
+#      LINE_API_BASE=http://127.0.0.1:8080 LINE_API_DATA_BASE=http://127.0.0.1:8080 python richmenu/daily_push.py
+import re, json, time, random, argparse, threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+from zoneinfo import ZoneInfo
+
+MAX_IMAGE_BYTES = 1024 * 1024
+JST = ZoneInfo("Asia/Tokyo")                  # LINE 統計的日期以 UTC+9 為準
+
+def user_id(i):
+    return f"U{i:032x}"
+
+class StubState:
+    """替身的全部狀態；followers 依序號即時產生，不必把 100 萬個 id 放在記憶體"""
+    def __init__(self, followers=1000, quota=None, latency_ms=0.0, jitter_ms=0.0,
+                 rate_limits=None, error_429=0.0, error_500=0.0, seed=None, blocks=0):
+        self.followers = followers
+        self.blocks = blocks                  # insight 統計用：封鎖人數
+        self.quota = quota                    # None = unlimited
+        self.latency_ms, self.jitter_ms = latency_ms, jitter_ms
+        self.rate_limits = rate_limits or {}  # endpoint 名稱 → 每秒上限
+        self.error_429, self.error_500 = error_429, error_500
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.usage = 0
+        self.menus, self.images, self.aliases = {}, {}, {}
+        self.default_menu, self.user_menus = None, {}
+        self.audiences = {}                   # audienceGroupId → {"ids", "status", "description"}
+        self.narrowcasts = {}                 # request id → {"target", "polls"}
+        self.replies = {}                     # replyToken → 收到時間（time.monotonic，load test 算端到端延遲）
+        self.retry_keys = {}                  # X-Line-Retry-Key → 第一次的 request id
+        self.sent = {}                        # request id → {"type", "count", "date"}（統計 API 用）
+        self.windows = {}                     # endpoint → (秒, 次數)
+        self.seq = 0
+        self.counts = {}                      # endpoint → 呼叫次數（bench 用）
+        self.first_at = None                  # 第一個請求到達的 time.perf_counter()（bench_startup 量冷啟動用；歸零 = None）
+
+    def next_id(self, prefix):
+        with self.lock:
+            self.seq += 1
+            return f"{prefix}{self.seq:032x}"
+
+    def hit(self, endpoint):
+        """回傳 None 或要注入的錯誤 (status, retry_after)"""
+        with self.lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+            limit = self.rate_limits.get(endpoint)
+            if limit:
+                sec = int(time.monotonic())
+                start, n = self.windows.get(endpoint, (sec, 0))
+                if start != sec:
+                    start, n = sec, 0
+                self.windows[endpoint] = (start, n + 1)
+                if n + 1 > limit:
+                    return 429, 1
+            roll = self.rng.random()
+        if roll < self.error_429:
+            return 429, 1
+        if roll < self.error_429 + self.error_500:
+            return 500, None
+        return None
+
+    def delay(self):
+        ms = self.latency_ms + (self.rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0)
+        if ms > 0:
+            time.sleep(ms / 1000)
+
+# (method, path regex, endpoint 名稱, handler 名稱)
+ROUTES = [
+    ("GET",    r"/followers/ids",                       "followers",  "followers_ids"),
+    ("POST",   r"/message/multicast",                   "multicast",  "multicast"),
+    ("POST",   r"/message/push",                        "push",       "push"),
+    ("POST",   r"/message/broadcast",                   "broadcast",  "broadcast"),
+    ("POST",   r"/message/reply",                       "reply",      "reply_message"),
+    ("POST",   r"/message/narrowcast",                  "narrowcast", "narrowcast"),
+    ("GET",    r"/message/progress/narrowcast",         "narrowcast", "narrowcast_progress"),
+    ("GET",    r"/message/quota",                       "quota",      "quota"),
+    ("GET",    r"/insight/followers",                   "insight",    "insight_followers"),
+    ("GET",    r"/insight/message/event",               "insight",    "message_event"),
+    ("GET",    r"/message/delivery/(?P<kind>reply|push|multicast|broadcast)", "delivery", "delivery"),
+    ("GET",    r"/message/quota/consumption",           "quota",      "consumption"),
+    ("POST",   r"/richmenu",                            "richmenu",   "create_menu"),
+    ("GET",    r"/richmenu/list",                       "richmenu",   "list_menus"),
+    ("POST",   r"/richmenu/alias",                      "alias",      "create_alias"),
+    ("GET",    r"/richmenu/alias/list",                 "alias",      "list_aliases"),
+    ("GET",    r"/richmenu/alias/(?P<alias>[^/]+)",     "alias",      "get_alias"),
+    ("POST",   r"/richmenu/alias/(?P<alias>[^/]+)",     "alias",      "update_alias"),
+    ("DELETE", r"/richmenu/alias/(?P<alias>[^/]+)",     "alias",      "delete_alias"),
+    ("POST",   r"/richmenu/bulk/link",                  "bulk",       "bulk_link"),
+    ("POST",   r"/richmenu/bulk/unlink",                "bulk",       "bulk_unlink"),
+    ("POST",   r"/richmenu/(?P<rid>richmenu-[0-9a-f]+)/content", "content", "upload"),
+    ("GET",    r"/richmenu/(?P<rid>richmenu-[0-9a-f]+)", "richmenu",  "get_menu"),
+    ("DELETE", r"/richmenu/(?P<rid>richmenu-[0-9a-f]+)", "richmenu",  "delete_menu"),
+    ("POST",   r"/user/all/richmenu/(?P<rid>richmenu-[0-9a-f]+)", "default", "set_default"),
+    ("GET",    r"/user/all/richmenu",                   "default",    "get_default"),
+    ("DELETE", r"/user/all/richmenu",                   "default",    "clear_default"),
+    ("GET",    r"/user/(?P<uid>U[0-9a-f]{32})/richmenu", "user",      "get_user_menu"),
+    ("POST",   r"/audienceGroup/upload/byFile",         "audience",   "create_audience"),
+    ("PUT",    r"/audienceGroup/upload/byFile",         "audience",   "add_audience"),
+    ("GET",    r"/audienceGroup/(?P<gid>\d+)",          "audience",   "get_audience"),
+    ("DELETE", r"/audienceGroup/(?P<gid>\d+)",          "audience",   "delete_audience"),
+]
+ROUTES = [(m, re.compile(r"^/v2/bot" + p + "$"), e, h) for m, p, e, h in ROUTES]
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"       # keep-alive，和真正的 LINE API 一樣
+    state = None                        # StubState（由 make_server 設定）
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=None, headers=None):
+        data = json.dumps(body if body is not None else {}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("X-Line-Request-Id", self.request_id)
+        for k, v in (headers or {}).items():
+            self.send_header(k, str(v))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def dispatch_route(self, method):
+        if self.state.first_at is None:
+            self.state.first_at = time.perf_counter()
+        parts = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        self.raw = self.rfile.read(length) if length else b""
+        self.query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        self.request_id = self.state.next_id("")
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            return self.reply(401, {"message": "Authentication failed"})
+        for m, pat, endpoint, name in ROUTES:
+            match = pat.match(parts.path)
+            if m == method and match:
+                self.state.delay()
+                err = self.state.hit(endpoint)
+                if err:
+                    status, wait = err
+                    return self.reply(status, {"message": "injected error"},
+                                      {"Retry-After": wait} if wait else None)
+                return getattr(self, name)(**match.groupdict())
+        return self.reply(404, {"message": "Not found"})
+
+    def do_GET(self):
+        self.dispatch_route("GET")
+
+    def do_POST(self):
+        self.dispatch_route("POST")
+
+    def do_PUT(self):
+        self.dispatch_route("PUT")
+
+    def do_DELETE(self):
+        self.dispatch_route("DELETE")
+
+    def body(self):
+        return json.loads(self.raw or b"{}")
+
+    def form(self):
+        """multipart/form-data → {欄位名: bytes}"""
+        head = f"Content-Type: {self.headers.get('Content-Type', '')}\r\n\r\n".encode("latin-1")
+        msg = BytesParser(policy=HTTP).parsebytes(head + self.raw)
+        return {part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+                for part in msg.iter_parts()} if msg.is_multipart() else {}
+
+    # ---------- followers ----------
+    def followers_ids(self):
+        limit = min(int(self.query.get("limit", 1000)), 1000)
+        start = int(self.query.get("start", 0))
+        end = min(start + limit, self.state.followers)
+        out = {"userIds": [user_id(i) for i in range(start, end)]}
+        if end < self.state.followers:
+            out["next"] = str(end)
+        self.reply(200, out)
+
+    # ---------- messages ----------
+    def _send(self, cost, status=200, kind=None):
+        key = self.headers.get("X-Line-Retry-Key")
+        st = self.state
+        with st.lock:
+            accepted = st.retry_keys.get(key) if key else None
+            over = st.quota is not None and st.usage + cost > st.quota
+            if not accepted and not over:
+                st.usage += cost
+                if key:
+                    st.retry_keys[key] = self.request_id
+                if kind:
+                    st.sent[self.request_id] = {"type": kind, "count": cost,
+                                                "date": f"{datetime.now(JST):%Y%m%d}"}
+        if accepted:
+            return self.reply(409, {"message": "The retry key is already accepted"},
+                              {"X-Line-Accepted-Request-Id": accepted})
+        if over:
+            return self.reply(429, {"message": "You have reached your monthly limit."})
+        self.reply(status, {})
+        return True
+
+    def multicast(self):
+        to = self.body().get("to", [])
+        if not 1 <= len(to) <= 500:
+            return self.reply(400, {"message": "The property, 'to', size must be between 1 and 500"})
+        self._send(len(to), kind="multicast")
+
+    def push(self):
+        self._send(1, kind="push")
+
+    def broadcast(self):
+        self._send(self.state.followers, kind="broadcast")
+
+    def reply_message(self):
+        body = self.body()
+        token, msgs = body.get("replyToken"), body.get("messages", [])
+        if not 1 <= len(msgs) <= 5:
+            return self.reply(400, {"message": "The property, 'messages', size must be between 1 and 5"})
+        with self.state.lock:
+            used = not token or token in self.state.replies
+            if not used:
+                self.state.replies[token] = time.monotonic()
+        if used:
+            return self.reply(400, {"message": "Invalid reply token"})
+        self.reply(200, {"sentMessages": [{"id": self.request_id}]})     # reply 不計入月額度
+
+    def narrowcast(self):
+        recipient = self.body().get("recipient") or {}
+        group = self.state.audiences.get(int(recipient.get("audienceGroupId") or 0))
+        if recipient.get("type") != "audience" or not group:
+            return self.reply(400, {"message": "audience group not found"})
+        if group["status"] != "READY":
+            return self.reply(400, {"message": "audience group is not ready"})
+        if self._send(len(group["ids"]), 202, kind="narrowcast"):
+            with self.state.lock:
+                self.state.narrowcasts[self.request_id] = {"target": len(group["ids"]), "polls": 0}
+
+    def narrowcast_progress(self):
+        with self.state.lock:
+            job = self.state.narrowcasts.get(self.query.get("requestId"))
+            if job:
+                job["polls"] += 1
+                polls = job["polls"]
+        if not job:
+            return self.reply(400, {"message": "requestId not found"})
+        if polls < 2:                   # 第一次查詢還在送，之後就完成
+            return self.reply(200, {"phase": "sending"})
+        self.reply(200, {"phase": "succeeded", "successCount": job["target"], "failureCount": 0,
+                         "targetCount": job["target"]})
+
+    def quota(self):
+        q = self.state.quota
+        self.reply(200, {"type": "none"} if q is None else {"type": "limited", "value": q})
+
+    def insight_followers(self):
+        date = self.query.get("date", "")
+        if not re.fullmatch(r"\d{8}", date):
+            return self.reply(400, {"message": "date is required (yyyyMMdd)"})
+        st = self.state
+        self.reply(200, {"status": "ready", "followers": st.followers + st.blocks,
+                         "targetedReaches": st.followers, "blocks": st.blocks})
+
+    def message_event(self):
+        """broadcast / narrowcast 的單則統計；開啟、點擊以固定比例模擬"""
+        job = self.state.sent.get(self.query.get("requestId"))
+        if not job or job["type"] not in ("broadcast", "narrowcast"):
+            return self.reply(404, {"message": "Not found"})
+        n = job["count"]
+        self.reply(200, {"overview": {"requestId": self.query["requestId"], "timestamp": int(time.time()),
+                                      "delivered": n, "uniqueImpression": n * 6 // 10, "uniqueClick": n // 10,
+                                      "uniqueMediaPlayed": None, "uniqueMediaPlayed100Percent": None},
+                         "messages": [{"seq": 1, "impression": n * 7 // 10, "uniqueImpression": n * 6 // 10}],
+                         "clicks": []})
+
+    def delivery(self, kind):
+        date = self.query.get("date", "")
+        if not re.fullmatch(r"\d{8}", date):
+            return self.reply(400, {"message": "date is required (yyyyMMdd)"})
+        if date >= f"{datetime.now(JST):%Y%m%d}":              # 當天的數字隔天才會 ready
+            return self.reply(200, {"status": "unready"})
+        with self.state.lock:
+            n = sum(j["count"] for j in self.state.sent.values() if j["type"] == kind and j["date"] == date)
+        self.reply(200, {"status": "ready", "success": n})
+
+    def consumption(self):
+        self.reply(200, {"totalUsage": self.state.usage})
+
+    # ---------- rich menus ----------
+    def create_menu(self):
+        body = self.body()
+        if "size" not in body or "areas" not in body:
+            return self.reply(400, {"message": "Invalid rich menu object"})
+        rid = self.state.next_id("richmenu-")
+        with self.state.lock:
+            self.state.menus[rid] = {**body, "richMenuId": rid}
+        self.reply(200, {"richMenuId": rid})
+
+    def list_menus(self):
+        with self.state.lock:
+            menus = list(self.state.menus.values())
+        self.reply(200, {"richmenus": menus})
+
+    def get_menu(self, rid):
+        menu = self.state.menus.get(rid)
+        self.reply(200, menu) if menu else self.reply(404, {"message": "Not found"})
+
+    def delete_menu(self, rid):
+        with self.state.lock:
+            found = self.state.menus.pop(rid, None)
+            self.state.images.pop(rid, None)
+        self.reply(200, {}) if found else self.reply(404, {"message": "Not found"})
+
+    def upload(self, rid):
+        if rid not in self.state.menus:
+            return self.reply(404, {"message": "Not found"})
+        if len(self.raw) > MAX_IMAGE_BYTES:
+            return self.reply(413, {"message": "Request Entity Too Large"})
+        if rid in self.state.images:
+            return self.reply(400, {"message": "An image has already been uploaded to the richmenu"})
+        self.state.images[rid] = len(self.raw)
+        self.reply(200, {})
+
+    # ---------- aliases ----------
+    def create_alias(self):
+        body = self.body()
+        alias, rid = body.get("richMenuAliasId"), body.get("richMenuId")
+        with self.state.lock:
+            if alias in self.state.aliases:
+                return self.reply(400, {"message": "conflict richmenu alias id"})
+            if rid not in self.state.images:
+                return self.reply(400, {"message": "richmenu not found or image not uploaded"})
+            self.state.aliases[alias] = rid
+        self.reply(200, {})
+
+    def list_aliases(self):
+        with self.state.lock:
+            aliases = [{"richMenuAliasId": a, "richMenuId": r} for a, r in self.state.aliases.items()]
+        self.reply(200, {"aliases": aliases})
+
+    def get_alias(self, alias):
+        rid = self.state.aliases.get(alias)
+        self.reply(200, {"richMenuAliasId": alias, "richMenuId": rid}) if rid else \
+            self.reply(404, {"message": "richmenu alias not found"})
+
+    def update_alias(self, alias):
+        rid = self.body().get("richMenuId")
+        with self.state.lock:
+            if alias not in self.state.aliases:
+                return self.reply(404, {"message": "richmenu alias not found"})
+            self.state.aliases[alias] = rid
+        self.reply(200, {})
+
+    def delete_alias(self, alias):
+        with self.state.lock:
+            found = self.state.aliases.pop(alias, None)
+        self.reply(200, {}) if found else self.reply(404, {"message": "richmenu alias not found"})
+
+    # ---------- default / per-user ----------
+    def set_default(self, rid):
+        if rid not in self.state.images:
+            return self.reply(400, {"message": "must upload richmenu image before applying it to user"})
+        self.state.default_menu = rid
+        self.reply(200, {})
+
+    def get_default(self):
+        rid = self.state.default_menu
+        self.reply(200, {"richMenuId": rid}) if rid else self.reply(404, {"message": "no default richmenu"})
+
+    def clear_default(self):
+        self.state.default_menu = None
+        self.reply(200, {})
+
+    def bulk_link(self):
+        body = self.body()
+        ids = body.get("userIds", [])
+        if not 1 <= len(ids) <= 500:
+            return self.reply(400, {"message": "userIds size must be between 1 and 500"})
+        with self.state.lock:
+            for uid in ids:
+                self.state.user_menus[uid] = body.get("richMenuId")
+        self.reply(202, {})
+
+    def bulk_unlink(self):
+        with self.state.lock:
+            for uid in self.body().get("userIds", []):
+                self.state.user_menus.pop(uid, None)
+        self.reply(202, {})
+
+    def get_user_menu(self, uid):
+        rid = self.state.user_menus.get(uid)
+        self.reply(200, {"richMenuId": rid}) if rid else self.reply(404, {"message": "the user has no richmenu"})
+
+    # ---------- audience groups ----------
+    def _uploaded_ids(self, form):
+        return {line.strip() for line in (form.get("file") or b"").decode("utf-8").splitlines() if line.strip()}
+
+    def create_audience(self):
+        form = self.form()
+        ids = self._uploaded_ids(form)
+        if not ids:
+            return self.reply(400, {"message": "file is empty"})
+        with self.state.lock:
+            self.state.seq += 1
+            gid = self.state.seq
+            self.state.audiences[gid] = {"ids": ids, "status": "IN_PROGRESS",
+                                         "description": (form.get("description") or b"").decode("utf-8")}
+        self.reply(202, {"audienceGroupId": gid, "type": "UPLOAD", "createRoute": "MESSAGING_API"})
+
+    def add_audience(self):
+        form = self.form()
+        gid = int(form.get("audienceGroupId") or 0)
+        with self.state.lock:
+            group = self.state.audiences.get(gid)
+            if group:
+                group["ids"] |= self._uploaded_ids(form)
+                group["status"] = "IN_PROGRESS"
+        self.reply(202, {}) if group else self.reply(400, {"message": "audience group not found"})
+
+    def get_audience(self, gid):
+        with self.state.lock:
+            group = self.state.audiences.get(int(gid))
+            if group:
+                out = {"audienceGroupId": int(gid), "status": group["status"], "type": "UPLOAD",
+                       "description": group["description"], "audienceCount": len(group["ids"])}
+                group["status"] = "READY"          # 查過一次之後就比對完成
+        self.reply(200, {"audienceGroup": out}) if group else self.reply(404, {"message": "audience group not found"})
+
+    def delete_audience(self, gid):
+        with self.state.lock:
+            found = self.state.audiences.pop(int(gid), None)
+        self.reply(202, {}) if found else self.reply(400, {"message": "audience group not found"})
+
+def make_server(state, host="127.0.0.1", port=0, handler=Handler):
+    """建立（尚未啟動的）替身 server；port=0 由系統挑空的 port"""
+    handler = type("BoundHandler", (handler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def start(state, host="127.0.0.1", port=0):
+    """背景執行緒啟動替身，回傳 (server, base_url)；用完呼叫 server.shutdown()"""
+    server = make_server(state, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+def parse_rate_limits(spec):
+    """'multicast=200,bulk=3' → {'multicast': 200, 'bulk': 3}"""
+    out = {}
+    for part in filter(None, (spec or "").split(",")):
+        k, v = part.split("=")
+        out[k.strip()] = int(v)
+    return out
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8080)
+    ap.add_argument("--followers", type=int, default=1000)
+    ap.add_argument("--quota", type=int, default=None, help="月額度（不給 = 無上限）")
+    ap.add_argument("--latency", type=float, default=0.0, help="每個請求的延遲（毫秒）")
+    ap.add_argument("--jitter", type=float, default=0.0, help="延遲抖動 ±毫秒")
+    ap.add_argument("--rate-limit", default="", help="每秒上限，例如 multicast=200,bulk=3")
+    ap.add_argument("--error-429", type=float, default=0.0, help="隨機注入 429 的比例（0~1）")
+    ap.add_argument("--error-500", type=float, default=0.0, help="隨機注入 500 的比例（0~1）")
+    args = ap.parse_args()
+
+    state = StubState(args.followers, args.quota, args.latency, args.jitter,
+                      parse_rate_limits(args.rate_limit), args.error_429, args.error_500)
+    server = make_server(state, args.host, args.port)
+    print(f"[Stub] LINE API 替身 http://{args.host}:{server.server_port} (followers={args.followers})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# menu_image.py
+# Rich menu 圖片處理：全程在記憶體（不寫 /tmp），JPEG 品質用二分搜尋壓到 1 MB 以內，結果依來源雜湊快取
+# PIL 在真的要解碼 / 壓圖時才 import：快取命中的部署不必載入
+import os, io, hashlib, threading
+from line_api import STATE_DIR
+import line_metrics
+
+W, H = 2500, 1686                    # Rich menu 大尺寸
+MAX_BYTES = 1_000_000                # LINE 圖片上限 1 MB
+CACHE_DIR = os.path.join(STATE_DIR, "images")
+
+def cache_key(data, *params):
+    """來源 bytes + 處理參數 → 快取鍵（參數改了就會重算）"""
+    h = hashlib.sha256(data)
+    h.update(repr(params).encode("utf-8"))
+    return h.hexdigest()
+
+def fit_contain(img, tw=W, th=H, bg=(0,0,0)):
+    """把圖等比縮放到剛好放得下（不裁切），不足的邊留背景色。"""
+    from PIL import Image
+    img = img.convert("RGB")
+    iw, ih = img.size
+    s = min(tw/iw, th/ih)             # 注意這裡是 min → 不裁切
+    nw, nh = int(iw*s), int(ih*s)
+    resized = img.resize((nw, nh), Image.LANCZOS)
+    canvas = Image.new("RGB", (tw, th), bg)
+    canvas.paste(resized, ((tw - nw)//2, (th - nh)//2))
+    return canvas
+
+def _jpeg(img, q):
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=q, optimize=True)
+    return buf.getvalue()
+
+def encode_jpeg(img, max_bytes=MAX_BYTES, qmin=30, qmax=95):
+    """放得進 max_bytes 的最高 JPEG 品質：先試 qmax（多數圖一次就過），不行再二分搜尋"""
+    data = _jpeg(img, qmax)
+    if len(data) <= max_bytes:
+        best = (qmax, data)
+    else:
+        best, lo, hi = None, qmin, qmax - 1
+        while lo <= hi:
+            q = (lo + hi) // 2
+            data = _jpeg(img, q)
+            if len(data) <= max_bytes:
+                best, lo = (q, data), q + 1
+            else:
+                hi = q - 1
+    if best is None:
+        raise ValueError(f"JPEG 品質 {qmin} 仍超過 {max_bytes} bytes")
+    print(f"[OK] JPEG quality={best[0]} size={len(best[1])} bytes")
+    return best[1]
+
+def _cached(key, build):
+    path = os.path.join(CACHE_DIR, f"{key}.jpg")
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        print(f"[Cache] image hit {key[:10]}")
+        return data
+    except OSError:
+        pass
+    data = build()
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)            # 原子寫入，併發部署（多 process / 多 channel 執行緒）不會讀到半個檔
+    return data
+
+def contain(path, tw=W, th=H, bg=(0,0,0), max_bytes=MAX_BYTES):
+    """讀檔 → 等比縮放置中 → 壓成 ≤ max_bytes 的 JPEG bytes；來源沒變就直接讀快取"""
+    with line_metrics.stage("image contain"):
+        return _contain(path, tw, th, bg, max_bytes)
+
+def _contain(path, tw, th, bg, max_bytes):
+    with open(path, "rb") as f:
+        data = f.read()
+    def build():
+        from PIL import Image
+        with line_metrics.stage("image fit_contain"):
+            img = fit_contain(Image.open(io.BytesIO(data)), tw, th, bg)
+        print(f"[OK] fitted (contain) {os.path.basename(path)} to {tw}x{th}")
+        with line_metrics.stage("image encode_jpeg"):
+            return encode_jpeg(img, max_bytes)
+    return _cached(cache_key(data, "contain", tw, th, tuple(bg), max_bytes), build)
+
+def prepare(path, tw=W, th=H, max_bytes=MAX_BYTES):
+    """已是成品尺寸的圖：檢查尺寸，≤ max_bytes 就原樣上傳，太大才重新壓 JPEG"""
+    with line_metrics.stage("image prepare"):
+        return _prepare(path, tw, th, max_bytes)
+
+def _prepare(path, tw, th, max_bytes):
+    with open(path, "rb") as f:
+        data = f.read()
+    from PIL import Image
+    img = Image.open(io.BytesIO(data))   # 只讀檔頭，不解碼像素
+    assert img.size == (tw, th), f"圖片需 {tw}x{th}，現在是 {img.size[0]}x{img.size[1]}"
+    if len(data) <= max_bytes and img.format in ("JPEG", "PNG"):
+        return data
+    return _cached(cache_key(data, "prepare", tw, th, max_bytes),
+                   lambda: encode_jpeg(img.convert("RGB"), max_bytes))
@@ -0,0 +1,226 @@
+# menu_render.py
+# 由格線規格（grid spec）產生 rich menu 圖片 + 對應的 areas：圖與點擊範圍出自同一份規格，不會對不上
+# 合成全部用 numpy 陣列運算（去背、上色、alpha 疊圖），格子（tile）依內容快取，同一批變體共用
+# numpy 只有這裡用到：pip install -r requirements-grid.txt（一般部署 / 推播只需要 requirements.txt）
+# 用法：python richmenu/menu_render.py richmenu/line/grid_comp.json --out build/ [--variant all]
+import os, json, time, hashlib, argparse
+from functools import lru_cache
+from pathlib import Path
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+import menu_image, line_metrics
+
+W, H = menu_image.W, menu_image.H
+KEY_TOL = (24, 72)           # 與去背色的距離：< 24 全透明、> 72 全不透明，中間線性（保留反鋸齒）
+
+# ---------- 規格 ----------
+def load_grid(path):
+    """讀 grid spec；icon / font 的相對路徑以規格檔所在資料夾為準"""
+    with open(path, encoding="utf-8") as f:
+        spec = json.load(f)
+    return resolve_paths(spec, Path(path).parent)
+
+def resolve_paths(spec, base):
+    spec = json.loads(json.dumps(spec))                  # 深拷貝，不改到呼叫端的 dict
+    if spec.get("font"):
+        spec["font"] = str(base / spec["font"])
+    for row in spec["rows"]:
+        for cell in row["cells"]:
+            if cell.get("icon"):
+                cell["icon"] = str(base / cell["icon"])
+    return spec
+
+def apply_variant(spec, name):
+    """variants[name] 覆寫最上層設定（background / tint / key…），其餘沿用"""
+    if not name:
+        return spec
+    return {**spec, **spec["variants"][name], "variant": name}
+
+def edges(total, weights):
+    """依權重把 total 切段，回傳 len+1 個邊界（與 tab_bar 同樣用 round，相鄰格子不重疊不留縫）"""
+    acc, out, s = 0, [0], float(sum(weights))
+    for w in weights:
+        acc += w
+        out.append(round(total * acc / s))
+    return out
+
+def layout(spec):
+    """→ [(cell, x, y, w, h)]；rows 的 height 與 cells 的 width 都是權重（或像素，合計等於尺寸時）"""
+    tw, th = spec.get("size", (W, H))
+    ys = edges(th, [r.get("height", 1) for r in spec["rows"]])
+    out = []
+    for i, row in enumerate(spec["rows"]):
+        xs = edges(tw, [c.get("width", 1) for c in row["cells"]])
+        for j, cell in enumerate(row["cells"]):
+            out.append((cell, xs[j], ys[i], xs[j + 1] - xs[j], ys[i + 1] - ys[i]))
+    return out
+
+def areas(spec, y_min=0):
+    """有 action 的格子 → LINE areas；y_min 以上（例如分頁列）的格子略過，交給 tab_bar()"""
+    return [{"bounds": {"x": x, "y": y, "width": w, "height": h}, "action": cell["action"]}
+            for cell, x, y, w, h in layout(spec) if cell.get("action") and y >= y_min]
+
+# ---------- 合成 ----------
+def _color(c):
+    return np.asarray(c, dtype=np.float32)
+
+def trim_box(img, key):
+    """icon 內容（與去背色差 > KEY_TOL[0] 的像素）的外框；原始素材四周留白很多，trim 後縮放才放得大"""
+    rgb = np.asarray(img.convert("RGB"), dtype=np.int16)
+    mask = np.abs(rgb - np.asarray(key, dtype=np.int16)).sum(axis=-1) > KEY_TOL[0]
+    mask &= np.asarray(img.getchannel("A")) > 0
+    rows, cols = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+    if not len(rows):
+        return None
+    return cols[0], rows[0], cols[-1] + 1, rows[-1] + 1
+
+@lru_cache(maxsize=64)
+def _icon(path, mtime, tw, th, fit, trim_key=None):
+    """icon → (h, w, 4) float32 陣列，已縮放到格子內；mtime 進 key，檔案改了就重讀"""
+    img = Image.open(path).convert("RGBA")
+    box = trim_box(img, trim_key) if trim_key else None
+    if box:
+        img = img.crop(box)
+    iw, ih = img.size
+    s = (max if fit == "cover" else min)(tw / iw, th / ih)
+    img = img.resize((max(1, round(iw * s)), max(1, round(ih * s))), Image.LANCZOS)
+    if fit == "cover":                                   # 置中裁切成剛好填滿
+        l, t = (img.width - tw) // 2, (img.height - th) // 2
+        img = img.crop((l, t, l + tw, t + th))
+    return np.asarray(img, dtype=np.float32)
+
+def _font(path, size, text):
+    """label 字型：規格的 font 或環境變數 MENU_FONT；都沒有時只有純 ASCII 能用內建字型。
+       畫不出來就報錯（ValueError），不產生少了文字的選單
+    """
+    path = path or os.getenv("MENU_FONT")
+    if path:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError as e:
+            raise ValueError(f"讀不到字型 {path}：{e}") from e
+    if text.isascii():
+        return ImageFont.load_default(size)
+    raise ValueError(f"label {text!r} 需要中文字型：在規格設定 font，或以環境變數 MENU_FONT 指定字型檔")
+
+def check_labels(spec):
+    """每個 label 都有字型可用（部署前先檢查，不要等到建好選單才在 render 時失敗）"""
+    for cell, x, y, w, h in layout(spec):
+        if cell.get("label"):
+            _font(spec.get("font"), int(cell.get("label_size", h // 6)), cell["label"])
+
+@lru_cache(maxsize=64)
+def _alpha(path, mtime, tw, th, fit, trim_key, key):
+    """縮放後 icon 的 alpha（已去背），(h, w, 1)；換配色的變體共用，不必重算"""
+    icon = _icon(path, mtime, tw, th, fit, trim_key)
+    alpha = icon[..., 3] / 255.0
+    if key is not None:                                  # 把 icon 原本的底色變透明
+        dist = np.abs(icon[..., :3] - _color(key)).sum(axis=-1)
+        lo, hi = KEY_TOL
+        alpha *= np.clip((dist - lo) / (hi - lo), 0.0, 1.0)
+    return alpha[..., None].astype(np.float32)
+
+def icon_layer(cell, w, h, key, tint):
+    """icon 縮放 + 去背 + 上色 → (rgb, alpha, x, y)；rgb 在上色時是單一顏色（靠 broadcast）"""
+    pad = int(cell.get("pad", 0))
+    trim_key = (key or (255, 255, 255)) if cell.get("trim") else None
+    args = (cell["icon"], os.path.getmtime(cell["icon"]), w - 2 * pad, h - 2 * pad, cell.get("fit", "contain"), trim_key)
+    alpha = _alpha(*args, key)
+    rgb = _color(tint) if tint is not None else _icon(*args)[..., :3]   # 上色：前景改成單一顏色，保留反鋸齒
+    ih, iw = alpha.shape[:2]
+    return rgb, alpha, (w - iw) // 2, (h - ih) // 2
+
+@lru_cache(maxsize=256)
+def _tile(cell_json, w, h, background, key, tint, font):
+    """一個格子的像素（uint8 (h, w, 3)）；以格子內容 + 尺寸 + 配色為 key 快取"""
+    cell = json.loads(cell_json)
+    tile = np.empty((h, w, 3), dtype=np.uint8)
+    tile[:] = cell.get("fill", background)
+    if cell.get("icon"):                                 # 只在 icon 範圍內做 alpha 疊圖：fg·a + bg·(1−a)
+        rgb, a, x, y = icon_layer(cell, w, h, key, cell.get("tint", tint))
+        region = tile[y:y + a.shape[0], x:x + a.shape[1]]
+        region[:] = (rgb * a + region * (1.0 - a) + 0.5).astype(np.uint8)
+    if cell.get("label"):
+        tile = draw_label(tile, cell, font, tint)
+    return tile
+
+def draw_label(pixels, cell, font, tint):
+    """文字置中；有 icon 時放在格子下緣（label_margin），沒有 icon 時垂直置中"""
+    h, w = pixels.shape[:2]
+    size = int(cell.get("label_size", h // 6))
+    f = _font(font, size, cell["label"])
+    img = Image.fromarray(pixels)
+    draw = ImageDraw.Draw(img)
+    l, t, r, b = draw.textbbox((0, 0), cell["label"], font=f)
+    x = (w - (r - l)) // 2
+    y = h - (b - t) - int(cell.get("label_margin", size // 2)) if cell.get("icon") else (h - (b - t)) // 2
+    draw.text((x - l, y - t), cell["label"], font=f, fill=tuple(cell.get("label_color", tint or (255, 255, 255))))
+    return np.asarray(img)
+
+def render(spec):
+    """grid spec → PIL Image（RGB）"""
+    check_labels(spec)
+    tw, th = spec.get("size", (W, H))
+    bg = tuple(spec.get("background", (0, 0, 0)))
+    key = tuple(spec["key"]) if spec.get("key") else None
+    tint = tuple(spec["tint"]) if spec.get("tint") else None
+    canvas = np.empty((th, tw, 3), dtype=np.uint8)    # 格子一定鋪滿整張，不必先填底色
+    for cell, x, y, w, h in layout(spec):
+        cell_json = json.dumps({k: v for k, v in cell.items() if k != "action"}, sort_keys=True, ensure_ascii=False)
+        canvas[y:y + h, x:x + w] = _tile(cell_json, w, h, bg, key, tint, spec.get("font"))
+    return Image.fromarray(canvas)
+
+def digest(spec):
+    """規格（不含 action）+ 用到的 icon / 字型內容的雜湊：決定圖片快取與選單名稱標籤"""
+    h = hashlib.sha256()
+    look = {k: v for k, v in spec.items() if k not in ("variants", "_note")}
+    font = spec.get("font") or os.getenv("MENU_FONT")
+    if font and any(c.get("label") for r in spec["rows"] for c in r["cells"]):
+        look["font"] = font                             # MENU_FONT 換了也要重畫
+        with open(font, "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    look["rows"] = [{**r, "cells": [{k: v for k, v in c.items() if k != "action"} for c in r["cells"]]}
+                    for r in spec["rows"]]
+    h.update(json.dumps(look, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    for path in sorted({c["icon"] for r in spec["rows"] for c in r["cells"] if c.get("icon")}):
+        with open(path, "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+def render_jpeg(spec, max_bytes=menu_image.MAX_BYTES):
+    """→ ≤ max_bytes 的 JPEG bytes；同一份規格（含 icon 內容）直接讀磁碟快取"""
+    check_labels(spec)                                   # 快取命中也要檢查，不沿用少了文字的舊圖
+    with line_metrics.stage("image render"):
+        return menu_image._cached(menu_image.cache_key(digest(spec).encode(), "render", max_bytes),
+                                  lambda: menu_image.encode_jpeg(render(spec), max_bytes))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("spec", nargs="+", help="grid spec JSON")
+    ap.add_argument("--out", default="build", help="輸出資料夾（<名稱>[-變體].jpg 與 .areas.json）")
+    ap.add_argument("--variant", action="append", default=[], help="變體名稱；all = 規格內全部；不給 = 只出原版")
+    ap.add_argument("--png", action="store_true", help="另存未壓縮的 PNG（預覽用）")
+    args = ap.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    t0, n = time.perf_counter(), 0
+    for path in args.spec:
+        spec = load_grid(path)
+        names = list(spec.get("variants", {})) if "all" in args.variant else args.variant
+        for name in [None] + names:
+            s = apply_variant(spec, name)
+            stem = Path(path).stem + (f"-{name}" if name else "")
+            t = time.perf_counter()
+            if args.png:
+                render(s).save(os.path.join(args.out, f"{stem}.png"))
+            data = render_jpeg(s)
+            with open(os.path.join(args.out, f"{stem}.jpg"), "wb") as f:
+                f.write(data)
+            with open(os.path.join(args.out, f"{stem}.areas.json"), "w", encoding="utf-8") as f:
+                json.dump(areas(s), f, ensure_ascii=False, indent=2)
+            n += 1
+            print(f"[OK] {stem}: {len(data)} bytes, {len(areas(s))} areas, {time.perf_counter() - t:.2f}s")
+    print(f"[Done] {n} 張，共 {time.perf_counter() - t0:.2f}s → {args.out}")
+
+if __name__ == "__main__":
+    main()
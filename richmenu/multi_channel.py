@@ -0,0 +1,202 @@
+# multi_channel.py
+# 一個 process 同時跑多個 LINE channel 的每日推播 / 選單部署（不必每個 channel 各開一個 workflow job）
+# - 每個 channel 各自的 token、設定（env 覆寫）與選單；各 channel 在自己的執行緒裡併發，總時間 ≈ 最慢的那個
+# - 速率桶、連線池、配額帳本、journal 都以 token 區分（line_api.client / state_path），channel 之間互不影響
+# - must_ok 失敗（SystemExit）或例外只算那個 channel 失敗，其他照跑；有任何失敗時最後 exit 1
+# - 併發 channel 的輸出每行前面加 [channel 名稱]，摘要列出各 channel 最後一個 [ERROR]
+# - 不以 token 分檔的路徑（FOLLOWER_STORE、DELIVERY_DB）不能從 process 環境變數共用，要在各 channel 的 env 設定
+# 用法：LINE_TOKEN_A=... LINE_TOKEN_B=... python richmenu/multi_channel.py --channels richmenu/line/channels.json [--flow deploy --flow push]
+import os, sys, json, time, argparse, threading, contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from pathlib import Path
+import line_api, daily_push, deploy_richmenu, deploy_richmenu_alias
+
+HERE = Path(__file__).resolve().parent
+FLOWS = ("deploy", "push")                           # 同一個 channel 內依這個順序執行
+PATH_KEYS = {"spec", "grid", "image", "imageA", "imageB"}
+CHANNEL = contextvars.ContextVar("channel", default=None)   # 目前這段程式在處理哪個 channel（line_api.submit 會帶進工作執行緒）
+_last_error = {}                                             # channel → 最後一行 [ERROR]（摘要用）
+
+class ChannelOutput:
+    """stdout 包裝：channel 執行緒（含它開出的工作執行緒）印的每一行加上 [名稱] 前綴，整行一次寫出不會交錯"""
+    def __init__(self, out):
+        self.out, self.lock, self.local = out, threading.Lock(), threading.local()
+
+    def write(self, text):
+        name = CHANNEL.get()
+        if name is None:
+            return self.out.write(text)
+        buf = getattr(self.local, "buf", "") + text
+        *lines, self.local.buf = buf.split("\n")
+        if lines:
+            with self.lock:
+                for line in lines:
+                    if line.startswith("[ERROR]"):
+                        _last_error[name] = line
+                    self.out.write(f"[{name}] {line}\n")
+        return len(text)
+
+    def flush(self):
+        self.out.flush()
+
+    def __getattr__(self, attr):
+        return getattr(self.out, attr)
+
+@contextmanager
+def channel_output():
+    old = sys.stdout
+    sys.stdout = ChannelOutput(old)
+    try:
+        yield
+    finally:
+        sys.stdout = old
+
+def load_channels(path):
+    """{"channels": [{"name", "token_env": "LINE_TOKEN_A" | "token": "...", "enabled": true,
+                      "env": {MODE / MESSAGE / FOLLOWER_STORE / QUOTA_* … 同 daily_push 的環境變數},
+                      "menus": {"spec": "tabs.json", ...deploy_richmenu_alias 參數}
+                             | {"grid": "grid_comp.json", "variant": "...", ...deploy_richmenu 參數}}]}
+       menus 內的檔案路徑以 channels 檔所在資料夾為準；token 建議用 token_env，不要寫進檔案
+       FOLLOWER_STORE 要寫在各 channel 的 env（不同路徑）；從 process 環境變數繼承會被拒絕（見 shared_paths）
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    channels = [c for c in data.get("channels", []) if c.get("enabled", True)]
+    names = [c["name"] for c in channels]
+    if len(names) != len(set(names)):
+        raise ValueError("channel name 不可重複")
+    base = Path(path).parent
+    for c in channels:
+        c["token"] = c.get("token") or os.getenv(c.get("token_env", ""), "")
+        if c.get("menus"):
+            c["menus"] = {k: str(base / v) if k in PATH_KEYS else v for k, v in c["menus"].items()}
+    return channels
+
+def channel_env(c, overrides=None):
+    """這個 channel 的設定：process 環境變數為底，疊上 channel 的 env，再疊上命令列（例如 DRY_RUN）"""
+    return {**os.environ, **{k: str(v) for k, v in c.get("env", {}).items()}, **(overrides or {})}
+
+def shared_paths(channels):
+    """推播會用到、但不以 token 分檔的路徑：從 process 環境變數繼承或兩個 channel 設成同一個，
+       就會讀到別的 channel 的好友 / 寫進同一份統計。回傳問題清單（空 = 沒問題）
+    """
+    problems, stores = [], {}
+    if os.getenv("DELIVERY_DB") or any("DELIVERY_DB" in c.get("env", {}) for c in channels):
+        problems.append("DELIVERY_DB 是整個 process 共用的路徑，各 channel 會寫進同一個 SQLite；"
+                        "多 channel 時不要設定（預設已依 token 分檔）")
+    for c in channels:
+        store = c.get("env", {}).get("FOLLOWER_STORE")
+        if store is None and os.getenv("FOLLOWER_STORE"):
+            problems.append(f"{c['name']}: FOLLOWER_STORE 從 process 環境變數繼承，會與其他 channel 共用同一份好友名單；"
+                            f"請在 channels 檔的 env 各自設定（\"\" = 不用 store）")
+        elif store:
+            stores.setdefault(os.path.abspath(os.path.expanduser(store)), []).append(c["name"])
+    problems += [f"{', '.join(names)}: FOLLOWER_STORE 指向同一個 {path}" for path, names in stores.items() if len(names) > 1]
+    return problems
+
+def deploy_args(menus, plan=False):
+    """menus 設定 → (部署模組, argparse Namespace)；有 spec / imageA / imageB 用分頁部署，否則單一選單"""
+    mod = deploy_richmenu_alias if menus.keys() & {"spec", "imageA", "imageB"} else deploy_richmenu
+    args = mod.parse_args([])
+    for k, v in menus.items():
+        attr = k.replace("-", "_")
+        if not hasattr(args, attr):
+            raise ValueError(f"menus 不支援的設定 {k!r}（{mod.__name__}）")
+        setattr(args, attr, v)
+    args.plan = args.plan or plan
+    return mod, args
+
+def run_flow(c, flow, env, resume, plan):
+    if flow == "deploy":
+        mod, args = deploy_args(c["menus"], plan)
+        mod.deploy(c["token"], args)
+    else:
+        daily_push.push(c["token"], env, resume)
+
+def run_channel(c, flows, resume=False, plan=False, overrides=None):
+    """回傳 {"name", "flows": {flow: "ok" | "skip" | 錯誤}, "seconds"}；錯誤不往外丟"""
+    CHANNEL.set(c["name"])                  # 在 run_all 給的 context 裡設定，只影響這個 channel
+    out, t0 = {"name": c["name"], "flows": {}}, time.perf_counter()
+    env = channel_env(c, overrides)
+    print(f"[Channel] 開始：{', '.join(flows)}")
+    for flow in flows:
+        if not c["token"]:
+            out["flows"][flow] = f"沒有 token（{c.get('token_env') or 'token'}）"
+            continue
+        if flow == "deploy" and not c.get("menus"):
+            out["flows"][flow] = "skip"
+            continue
+        _last_error.pop(c["name"], None)      # 只看這個流程印出的 [ERROR]
+        try:
+            run_flow(c, flow, env, resume, plan)
+            status = "ok"
+        except SystemExit as e:                 # must_ok / sys.exit：只有這個 channel 的這個流程失敗
+            status = "ok" if e.code in (0, None) else f"exit {e.code}"
+            if status != "ok" and _last_error.get(c["name"]):
+                status += f"（{_last_error[c['name']]}）"
+        except Exception as e:
+            status = f"{type(e).__name__}: {e}"
+        if status != "ok":
+            print(f"[ERROR] {flow}：{status}")
+        out["flows"][flow] = status
+    _last_error.pop(c["name"], None)
+    out["seconds"] = round(time.perf_counter() - t0, 3)
+    print(f"[Channel] 結束（{out['seconds']:.2f}s）")
+    return out
+
+def run_all(channels, flows, workers=None, **kw):
+    """所有 channel 併發；回傳依 channels 順序排列的結果"""
+    workers = int(workers or os.getenv("CHANNEL_WORKERS", "0")) or len(channels) or 1
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="channel") as pool:
+        futs = {line_api.submit(pool, run_channel, c, flows, **kw): c["name"] for c in channels}
+        for f in as_completed(futs):
+            results[futs[f]] = f.result()
+    return [results[c["name"]] for c in channels]
+
+def failed(result):
+    return any(s not in ("ok", "skip") for s in result["flows"].values())
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--channels", default=os.getenv("CHANNELS", str(HERE / "line" / "channels.json")))
+    ap.add_argument("--flow", action="append", choices=FLOWS, help="要跑的流程（可重複；預設只有 push）")
+    ap.add_argument("--only", action="append", default=[], help="只跑指定名稱的 channel（可重複）")
+    ap.add_argument("--resume", action="store_true", default=os.getenv("RESUME", "0") == "1",
+                    help="multicast：各 channel 只補送上次未成功的批次")
+    ap.add_argument("--dry-run", action="store_true", help="推播只試跑（各 channel 設 DRY_RUN=1）")
+    ap.add_argument("--plan", action="store_true", help="選單只印出差異，不做變更")
+    ap.add_argument("--workers", type=int, default=None, help="同時處理的 channel 數（預設 = channel 數，或 CHANNEL_WORKERS）")
+    args = ap.parse_args()
+
+    channels = load_channels(args.channels)
+    if args.only:
+        unknown = set(args.only) - {c["name"] for c in channels}
+        if unknown:
+            print(f"[ERROR] 找不到 channel：{', '.join(sorted(unknown))}"); sys.exit(1)
+        channels = [c for c in channels if c["name"] in args.only]
+    if not channels:
+        print("沒有要處理的 channel"); return
+    flows = [f for f in FLOWS if f in (args.flow or ["push"])]
+    problems = shared_paths(channels) if "push" in flows and len(channels) > 1 else []
+    if problems:
+        for p in problems:
+            print(f"[ERROR] {p}")
+        sys.exit(1)
+
+    t0 = time.perf_counter()
+    with channel_output():
+        results = run_all(channels, flows, args.workers, resume=args.resume, plan=args.plan,
+                          overrides={"DRY_RUN": "1"} if args.dry_run else None)
+    wall = time.perf_counter() - t0
+
+    print(f"\n[Summary] {len(results)} 個 channel，總時間 {wall:.2f}s（各 channel 加總 {sum(r['seconds'] for r in results):.2f}s）")
+    for r in results:
+        flows_s = "  ".join(f"{k}={v}" for k, v in r["flows"].items())
+        print(f"  {'FAIL' if failed(r) else 'OK  '} {r['name']:<20} {r['seconds']:>7.2f}s  {flows_s}")
+    if any(failed(r) for r in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+# push_scheduler.py
+# 常駐推播排程：一個 process 管多個 campaign（各自時區 / 時間 / 對象）
+# - 同一時間（COALESCE_WINDOW 秒內）到期、對象相同的 campaign 合併成同一個請求（最多 5 則訊息，只算一次）
+# - 連線池、速率桶、配額快取、好友清單 / 好友 store 都留在記憶體裡重用，不必每次冷啟動
+# - 每個 campaign 上次觸發的時間存在 STATE_DIR，重啟後不會重送；停機期間錯過的在 GRACE 內補送
+# 用法：LINE_TOKEN=... python richmenu/push_scheduler.py --campaigns richmenu/line/campaigns.json
+import os, sys, json, time, signal, argparse, threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from zoneinfo import ZoneInfo
+import line_metrics, audience, daily_push, delivery_stats
+from line_api import state_path
+from daily_push import MAX_MESSAGES
+
+HERE = Path(__file__).resolve().parent
+DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+# ---------- Campaign 規格 ----------
+def parse_campaign(c):
+    """{"name", "tz", "at": ["09:00"], "days": ["mon", ...] | 省略=每天, "once": ISO 時間,
+        "target": {"mode": "broadcast" | "multicast" | "narrowcast", "ids": [...] | "followers": true,
+                   "include": [...], "exclude": [...], "audience": 受眾名稱},
+        "messages": [message 物件] | "text": "..." | "default_text": true（同 daily_push，"message" 可覆寫內文）}
+    """
+    out = dict(c)
+    out["tz"] = c.get("tz", "Asia/Taipei")
+    ZoneInfo(out["tz"])                                  # 時區打錯就在載入時報錯
+    out["at"] = sorted(tuple(int(x) for x in t.split(":")) for t in c.get("at", []))
+    out["days"] = {DAYS.index(d[:3].lower()) for d in c.get("days", DAYS)}
+    out["once"] = parse_once(c["once"], out["tz"]) if c.get("once") else None
+    out["target"] = c.get("target", {"mode": "broadcast"})
+    if not out["at"] and not out["once"]:
+        raise ValueError(f"campaign {c.get('name')!r} 需要 at 或 once")
+    if out["target"].get("mode", "broadcast") not in ("broadcast", "multicast", "narrowcast"):
+        raise ValueError(f"campaign {c.get('name')!r}: 不支援的 mode {out['target'].get('mode')!r}")
+    check_target(c.get("name"), out["target"])
+    if len(messages_for(out)) > MAX_MESSAGES:
+        raise ValueError(f"campaign {c.get('name')!r} 超過 {MAX_MESSAGES} 則訊息")
+    return out
+
+def parse_once(value, tz):
+    """once 的 ISO 時間；沒寫時差才當成 campaign 的 tz，有寫（例如 2025-01-01T09:00+00:00）就照它的時差"""
+    dt = datetime.fromisoformat(value)
+    return dt.replace(tzinfo=ZoneInfo(tz)) if dt.tzinfo is None else dt
+
+def check_target(name, target):
+    """multicast / narrowcast 的對象必須明確：非空的 ids，或 "followers": true（全部好友）；
+       空的 ids 不能當成「全部好友」，否則還沒填名單就啟用會發給所有人
+    """
+    if target.get("mode", "broadcast") == "broadcast":
+        return
+    has_ids, followers = "ids" in target, target.get("followers") is True
+    if has_ids and followers:
+        raise ValueError(f"campaign {name!r}: ids 與 followers 只能擇一")
+    if has_ids and (not isinstance(target["ids"], list) or not target["ids"]):
+        raise ValueError(f"campaign {name!r}: ids 是空的（要發給全部好友請改用 \"followers\": true）")
+    if not has_ids and not followers:
+        raise ValueError(f"campaign {name!r}: {target['mode']} 需要 ids 或 \"followers\": true")
+
+def load_campaigns(path):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    campaigns = [parse_campaign(c) for c in data.get("campaigns", []) if c.get("enabled", True)]
+    names = [c["name"] for c in campaigns]
+    if len(names) != len(set(names)):
+        raise ValueError("campaign name 不可重複")
+    return campaigns
+
+def next_fire(c, after):
+    """c 在 after（aware datetime）之後的下一個觸發時間；沒有了回傳 None"""
+    if c["once"]:
+        return c["once"] if c["once"] > after else None
+    tz = ZoneInfo(c["tz"])
+    day0 = after.astimezone(tz).date()
+    for d in range(8):
+        day = day0 + timedelta(days=d)
+        if day.weekday() not in c["days"]:
+            continue
+        for hh, mm in c["at"]:
+            t = datetime(day.year, day.month, day.day, hh, mm, tzinfo=tz)
+            if t > after:
+                return t
+    return None
+
+def messages_for(c):
+    if c.get("messages"):
+        return list(c["messages"])
+    if c.get("default_text"):
+        return [{"type": "text", "text": daily_push.make_default_text(c["tz"], c.get("message"))}]
+    return [{"type": "text", "text": c["text"]}] if c.get("text") else []
+
+def target_key(target):
+    return json.dumps(target, sort_keys=True, ensure_ascii=False)
+
+def coalesce(due):
+    """due = [(fire, campaign), ...] → [(target, [messages ≤5], [campaign names], fire), ...]
+       對象相同的合併，訊息依觸發時間 / 名稱排序後每 5 則一組
+    """
+    groups = {}
+    for fire, c in sorted(due, key=lambda x: (x[0], x[1]["name"])):
+        g = groups.setdefault(target_key(c["target"]), {"target": c["target"], "items": [], "fire": fire})
+        g["items"] += [(m, c["name"]) for m in messages_for(c)]
+    out = []
+    for g in groups.values():
+        items = g["items"]
+        for i in range(0, len(items), MAX_MESSAGES):
+            part = items[i:i + MAX_MESSAGES]
+            names = list(dict.fromkeys(n for _, n in part))
+            out.append((g["target"], [m for m, _ in part], names, g["fire"]))
+    return out
+
+# ---------- Scheduler ----------
+class Scheduler:
+    def __init__(self, token, path, grace=None, window=None, dry=False):
+        self.token, self.path, self.dry = token, path, dry
+        self.grace  = float(grace if grace is not None else os.getenv("SCHEDULE_GRACE", "1800"))
+        self.window = float(window if window is not None else os.getenv("COALESCE_WINDOW", "60"))
+        self.state_file = state_path("scheduler.json", token)
+        self.stop = threading.Event()
+        self.campaigns, self.mtime = [], None
+        self.followers, self.followers_at = None, 0.0
+        self.follower_ttl = float(os.getenv("FOLLOWER_CACHE_TTL", "3600"))
+        self.last = self.load_state()
+
+    # ----- 狀態 -----
+    def load_state(self):
+        try:
+            with open(self.state_file, encoding="utf-8") as f:
+                return {k: datetime.fromisoformat(v) for k, v in json.load(f).items()}
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self):
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        tmp = f"{self.state_file}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({k: v.isoformat() for k, v in self.last.items()}, f, indent=2)
+        os.replace(tmp, self.state_file)
+
+    def reload(self):
+        """campaign 檔有改就重新載入（不必重啟 daemon）；格式錯誤時沿用舊的"""
+        mtime = os.path.getmtime(self.path)
+        if mtime == self.mtime:
+            return
+        try:
+            self.campaigns = load_campaigns(self.path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[ERROR] 載入 {self.path} 失敗，沿用舊設定：{e}")
+            return
+        self.mtime = mtime
+        print(f"[Scheduler] 載入 {len(self.campaigns)} 個 campaign（{self.path}）")
+
+    def upcoming(self, now):
+        """[(fire, campaign)]：每個 campaign 下一次（或錯過但仍在 grace 內）的觸發時間"""
+        out = []
+        for c in self.campaigns:
+            last = self.last.get(c["name"])
+            fire = next_fire(c, last if last else now - timedelta(seconds=self.window))
+            while fire and fire < now - timedelta(seconds=self.grace):
+                print(f"[Skip] {c['name']}：{fire:%Y-%m-%d %H:%M %Z} 已超過補送時限")
+                self.last[c["name"]] = fire
+                fire = next_fire(c, fire)
+            if fire:
+                out.append((fire, c))
+        return out
+
+    # ----- 對象 -----
+    def follower_list(self):
+        """沒有 FOLLOWER_STORE 時的好友清單快取：TTL 內重用，不必每次重翻 followers/ids"""
+        if self.followers is None or time.time() - self.followers_at > self.follower_ttl:
+            self.followers = daily_push.list_followers(self.token)
+            self.followers_at = time.time()
+            print(f"[Followers] 重新抓取好友清單：{len(self.followers)} 人")
+        return self.followers
+
+    def recipients(self, target):
+        """回傳 (id 串流, 人數)；對象的寫法已由 check_target 檢查過"""
+        if "ids" in target:
+            return list(target["ids"]), len(target["ids"])
+        if target.get("followers") is not True:
+            raise ValueError(f"對象沒有 ids 也沒有 \"followers\": true：{target_key(target)}")
+        include, exclude = target.get("include", []), target.get("exclude", [])
+        store = daily_push.follower_store(self.token)       # 每次重開：webhook 寫入的 follow/unfollow 也算進來
+        if store is not None:
+            return daily_push.target_ids(self.token, store, include, exclude), store.count_targets(include, exclude)
+        ids = list(daily_push.target_ids(self.token, include=include, exclude=exclude, followers=self.follower_list()))
+        return ids, len(ids)
+
+    # ----- 發送 -----
+    def send(self, target, msgs, tag, campaign):
+        """campaign：成效統計歸屬的名稱（合併送出時是多個 campaign 名稱以 + 串起來）"""
+        mode = target.get("mode", "broadcast")
+        if mode == "broadcast":
+            ids, cost = None, daily_push.estimate_broadcast_cost(self.token)
+        else:
+            ids, cost = self.recipients(target)
+        ledger = daily_push.QuotaLedger(self.token).load()
+        if daily_push.should_skip_by_quota(self.token, expected_cost=cost, ledger=ledger):
+            return False
+        if mode == "broadcast":
+            rid = daily_push.send_broadcast(self.token, msgs)
+            delivery_stats.record_send(self.token, mode, campaign, cost or None, rid)
+        elif mode == "narrowcast":
+            group_id = audience.sync_audience(self.token, ids, target.get("audience", "scheduler"))
+            rid = daily_push.send_narrowcast(self.token, group_id, msgs)
+            progress = daily_push.wait_narrowcast(self.token, rid)
+            delivery_stats.record_send(self.token, mode, campaign, progress.get("successCount", cost), rid)
+            return progress.get("phase") != "failed"
+        else:
+            journal = daily_push.multicast_journal(self.token, f"{campaign}@{tag}").load()   # 重啟後同一次觸發可續送
+            sent = []
+            failed = daily_push.dispatch_multicast(self.token, ids, msgs, ledger=ledger, journal=journal,
+                                                   on_sent=lambda n, rid: sent.append(n))
+            if sent:
+                delivery_stats.record_send(self.token, mode, campaign, sum(sent))
+            return not failed
+        return True
+
+    def fire(self, due):
+        for target, msgs, names, fire in coalesce(due):
+            label = f"{target.get('mode', 'broadcast')} ← {', '.join(names)}（{len(msgs)} 則）"
+            print(f"[Fire] {fire:%Y-%m-%d %H:%M %Z} {label}")
+            if self.dry:
+                for m in msgs:
+                    print("   ", json.dumps(m, ensure_ascii=False))
+                continue
+            try:
+                ok = self.send(target, msgs, fire.isoformat(), "+".join(names))
+            except SystemExit:                 # must_ok 失敗：這一組記錯誤，daemon 繼續跑
+                ok = False
+            except Exception as e:
+                print(f"[ERROR] {label}: {type(e).__name__}: {e}")
+                ok = False
+            if not ok:
+                print(f"[ERROR] {label} 未完成")
+        for fire, c in due:
+            self.last[c["name"]] = fire
+        self.save_state()
+        if not self.dry:
+            daily_push.collect_stats(self.token)      # 順便收集之前各次發送的成效（到期的才抓）
+        if line_metrics.ENABLED and not self.dry:
+            line_metrics.write_summary(reset_after=True)   # 每次觸發一份摘要，不從 daemon 啟動累計
+
+    def run(self):
+        while not self.stop.is_set():
+            self.reload()
+            now = datetime.now(timezone.utc)
+            upcoming = self.upcoming(now)
+            if not upcoming:
+                print("[Scheduler] 沒有排定的 campaign，等待設定檔更新…")
+                self.stop.wait(60)
+                continue
+            first = min(f for f, _ in upcoming)
+            if first > now:
+                self.stop.wait(min((first - now).total_seconds(), 60))    # 最多睡 60 秒，順便檢查設定檔
+                continue
+            due = [(f, c) for f, c in upcoming if f <= first + timedelta(seconds=self.window)]
+            self.fire(due)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--campaigns", default=os.getenv("CAMPAIGNS", str(HERE / "line" / "campaigns.json")))
+    ap.add_argument("--list", action="store_true", help="列出每個 campaign 接下來的觸發時間後結束")
+    ap.add_argument("--dry-run", action="store_true", default=os.getenv("DRY_RUN", "0") == "1",
+                    help="到期時只印出合併後的訊息，不發送")
+    args = ap.parse_args()
+
+    token = os.getenv("LINE_TOKEN")
+    if not token:
+        print("請以環境變數 LINE_TOKEN 提供 Channel access token")
+        sys.exit(1)
+
+    sched = Scheduler(token, args.campaigns, dry=args.dry_run)
+    sched.reload()
+    if args.list:
+        now = datetime.now(timezone.utc)
+        for fire, c in sorted(sched.upcoming(now), key=lambda x: x[0]):
+            print(f"  {fire:%Y-%m-%d %H:%M %Z}  {c['name']:<20} {target_key(c['target'])}")
+        return
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: sched.stop.set())
+    print(f"[Scheduler] 啟動（coalesce {sched.window:.0f}s, grace {sched.grace:.0f}s{', DRY RUN' if sched.dry else ''}）")
+    sched.run()
+    print("[Scheduler] 已停止")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# reconcile.py
+# 宣告式 rich menu 部署：讀現況（menus / aliases / default）→ 算出最小差異 → 只做必要的操作
+import json, hashlib
+from concurrent.futures import ThreadPoolExecutor
+import line_api
+from line_api import API_DATA, must_ok
+
+MENU_FIELDS = ("size", "selected", "name", "chatBarText", "areas")
+
+def digest(*parts):
+    """圖片來源 + 處理參數的雜湊；寫進選單名稱，之後就能判斷圖是否變過"""
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(p if isinstance(p, bytes) else repr(p).encode("utf-8"))
+    return h.hexdigest()[:10]
+
+def tagged_name(name, image_digest):
+    return f"{name} [{image_digest}]"
+
+def fingerprint(menu):
+    return json.dumps({k: menu.get(k) for k in MENU_FIELDS}, sort_keys=True, ensure_ascii=False)
+
+def run_all(jobs, workers=8):
+    """併發執行互不相依的操作；任何一個 must_ok 失敗都會在這裡拋出"""
+    if not jobs:
+        return []
+    with ThreadPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        futures = [line_api.submit(pool, fn, *args) for fn, *args in jobs]
+        return [f.result() for f in futures]
+
+# ---------- 讀現況 ----------
+def fetch_menus(token):
+    r = line_api.get(token, "/richmenu/list")
+    must_ok(r, "list menus")
+    return {m["richMenuId"]: m for m in r.json().get("richmenus", [])}
+
+def fetch_aliases(token):
+    r = line_api.get(token, "/richmenu/alias/list")
+    must_ok(r, "list aliases")
+    return {a["richMenuAliasId"]: a["richMenuId"] for a in r.json().get("aliases", [])}
+
+def fetch_default(token):
+    r = line_api.get(token, "/user/all/richmenu")
+    return r.json().get("richMenuId") if r.status_code == 200 else None
+
+def fetch_state(token):
+    """menus / aliases / default 三個 GET 一次併發讀完"""
+    menus, aliases, default = run_all([(fetch_menus, token), (fetch_aliases, token), (fetch_default, token)])
+    return {"menus": menus, "aliases": aliases, "default": default}
+
+# ---------- 算差異 ----------
+def plan(state, desired):
+    """desired = {
+         "menus":   {key: {"body": {...}, "image": callable → JPEG/PNG bytes}},
+         "aliases": {alias_id: key},
+         "default": key 或 None（None = 不動）,
+         "prune":   True → 刪掉其他選單，以及指向被刪選單的 alias
+       }
+       回傳 (ops, ids)：ids 是已存在、可直接沿用的 {key: richMenuId}
+    """
+    by_fp = {fingerprint(m): rid for rid, m in state["menus"].items()}
+    ids, ops = {}, []
+    for key, spec in desired["menus"].items():
+        rid = by_fp.get(fingerprint(spec["body"]))
+        if rid:
+            ids[key] = rid
+            ops.append(("keep", key, rid))
+        else:
+            ops.append(("create", key))
+
+    for alias, key in desired.get("aliases", {}).items():
+        cur = state["aliases"].get(alias)
+        if cur is None:
+            ops.append(("alias_create", alias, key))
+        elif cur != ids.get(key):
+            ops.append(("alias_update", alias, key))
+
+    key = desired.get("default")
+    if key and (key not in ids or state["default"] != ids[key]):
+        ops.append(("default", key))
+
+    if desired.get("prune"):
+        keep = set(ids.values())
+        stale = [rid for rid in state["menus"] if rid not in keep]
+        for alias, rid in state["aliases"].items():
+            if rid in stale and alias not in desired.get("aliases", {}):
+                ops.append(("delete_alias", alias))
+        ops += [("delete_menu", rid) for rid in stale]
+    return ops, ids
+
+def print_plan(ops, state):
+    changes = [op for op in ops if op[0] != "keep"]
+    for op in ops:
+        kind = op[0]
+        if kind == "keep":
+            print(f"  = keep   menu {op[1]} ({op[2]})")
+        elif kind == "create":
+            print(f"  + create menu {op[1]} (+ upload image)")
+        elif kind == "alias_create":
+            print(f"  + create alias {op[1]} -> {op[2]}")
+        elif kind == "alias_update":
+            print(f"  ~ update alias {op[1]}: {state['aliases'].get(op[1])} -> {op[2]}")
+        elif kind == "default":
+            print(f"  ~ default(all): {state['default']} -> {op[1]}")
+        elif kind == "delete_alias":
+            print(f"  - delete alias {op[1]}")
+        elif kind == "delete_menu":
+            name = state["menus"].get(op[1], {}).get("name", "")
+            print(f"  - delete menu {op[1]} ({name})")
+    print(f"[Plan] {len(changes)} 個變更" if changes else "[Plan] 沒有變更")
+
+# ---------- 套用 ----------
+def create_menu(token, body):
+    r = line_api.post(token, "/richmenu", json_body=body)
+    must_ok(r, f"create {body['name']}")
+    rid = r.json()["richMenuId"]
+    print(f"[OK] created {body['name']}: {rid}")
+    return rid
+
+def upload_image(token, richmenu_id, data, content_type="image/jpeg"):
+    r = line_api.post(token, f"{API_DATA}/richmenu/{richmenu_id}/content",
+                      headers={'Content-Type': content_type}, data=data)
+    must_ok(r, f"upload image -> {richmenu_id}")
+
+def delete_menu(token, rid):
+    r = line_api.delete(token, f"/richmenu/{rid}")
+    must_ok(r, f"delete {rid}")
+
+def create_and_upload(token, spec):
+    """建立 + 上傳；上傳失敗就把空選單刪掉，避免下次被當成「已部署」沿用"""
+    rid = create_menu(token, spec["body"])
+    data = spec["image"]()
+    ctype = "image/png" if data[:8] == b"\x89PNG\r\n\x1a\n" else "image/jpeg"
+    try:
+        upload_image(token, rid, data, ctype)
+    except SystemExit:
+        delete_menu(token, rid)
+        raise
+    return rid
+
+def set_alias(token, alias_id, richmenu_id, exists):
+    if exists:
+        r = line_api.post(token, f"/richmenu/alias/{alias_id}", json_body={"richMenuId": richmenu_id})
+        must_ok(r, f"update alias {alias_id} -> {richmenu_id}")
+    else:
+        r = line_api.post(token, "/richmenu/alias",
+                          json_body={"richMenuAliasId": alias_id, "richMenuId": richmenu_id})
+        must_ok(r, f"create alias {alias_id} -> {richmenu_id}")
+
+def delete_alias(token, alias_id):
+    r = line_api.delete(token, f"/richmenu/alias/{alias_id}")
+    must_ok(r, f"delete alias {alias_id}")
+
+def set_default_all(token, richmenu_id):
+    r = line_api.post(token, f"/user/all/richmenu/{richmenu_id}")
+    must_ok(r, f"set default(all) -> {richmenu_id}")
+
+def apply(token, ops, ids, desired):
+    """分三階段，每階段內互不相依的操作併發：
+       1) 建立 + 上傳新選單  2) alias / default 指向新選單  3) 刪除舊 alias、舊選單
+    """
+    creates = [op[1] for op in ops if op[0] == "create"]
+    for key, rid in zip(creates, run_all([(create_and_upload, token, desired["menus"][k]) for k in creates])):
+        ids[key] = rid
+
+    run_all([(set_alias, token, op[1], ids[op[2]], op[0] == "alias_update")
+             for op in ops if op[0] in ("alias_create", "alias_update")]
+            + [(set_default_all, token, ids[op[1]]) for op in ops if op[0] == "default"])
+
+    run_all([(delete_alias, token, op[1]) for op in ops if op[0] == "delete_alias"])
+    run_all([(delete_menu, token, op[1]) for op in ops if op[0] == "delete_menu"])
+    return ids
+
+def reconcile(token, desired, dry_run=False):
+    """讀現況 → 印出計畫 →（非 dry-run 時）套用；回傳 {key: richMenuId}"""
+    state = fetch_state(token)
+    ops, ids = plan(state, desired)
+    print_plan(ops, state)
+    if dry_run:
+        print("[DRY RUN] 只印出計畫，不做任何變更")
+        return ids
+    return apply(token, ops, ids, desired)
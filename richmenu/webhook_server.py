@@ -0,0 +1,267 @@
+# webhook_server.py
+# 處理 rich menu A 頁的 postback（sec=contact / events / musicians / actors，&page=N）
+# asyncio + 標準庫 HTTP/1.1：驗簽 → 先回 200 → 背景用共用連線池呼叫 reply API
+# 回覆內容啟動時就預先 render 成 JSON（LRU 快取，key = (section, page)），收到事件只剩組字串 + 送出
+# 用法：CHANNEL_SECRET=... LINE_TOKEN=... python richmenu/webhook_server.py --port 8000
+import os, sys, json, hmac, base64, asyncio, hashlib, argparse, threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import parse_qs
+import line_api
+from follower_store import FollowerStore
+
+HERE = Path(__file__).resolve().parent
+SECTIONS_FILE = os.getenv("SECTIONS_FILE", str(HERE / "line" / "sections.json"))
+MAX_BODY = 1024 * 1024
+CACHE_SIZE = int(os.getenv("REPLY_CACHE_SIZE", "256"))
+
+# ---------- 簽章 ----------
+def signature(secret, body):
+    return base64.b64encode(hmac.new(secret.encode("utf-8"), body, hashlib.sha256).digest()).decode()
+
+def verify_signature(secret, body, sig):
+    """X-Line-Signature = base64(HMAC-SHA256(channel secret, request body))"""
+    return bool(sig) and hmac.compare_digest(signature(secret, body), sig)
+
+# ---------- 內容 ----------
+def load_sections(path=SECTIONS_FILE):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def parse_postback(data):
+    """'sec=events&page=2' → ('events', 2)；沒有 sec 回傳 (None, 1)"""
+    q = parse_qs(data or "")
+    sec = q.get("sec", [None])[0]
+    try:
+        page = max(1, int(q.get("page", ["1"])[0]))
+    except ValueError:
+        page = 1
+    return sec, page
+
+def page_count(sec_spec, page_size):
+    items = sec_spec.get("items")
+    return max(1, -(-len(items) // page_size)) if items else 1
+
+def bubble(item):
+    body = [{"type": "text", "text": item["title"], "weight": "bold", "size": "lg", "wrap": True}]
+    if item.get("text"):
+        body.append({"type": "text", "text": item["text"], "size": "sm", "color": "#666666", "wrap": True})
+    out = {"type": "bubble", "body": {"type": "box", "layout": "vertical", "spacing": "sm", "contents": body}}
+    if item.get("image"):
+        out["hero"] = {"type": "image", "url": item["image"], "size": "full", "aspectMode": "cover"}
+    if item.get("uri"):
+        out["footer"] = {"type": "box", "layout": "vertical", "contents": [
+            {"type": "button", "style": "link", "action": {"type": "uri", "label": "詳細資訊", "uri": item["uri"]}}]}
+    return out
+
+def nav_quick_reply(sec, page, pages):
+    """上一頁 / 下一頁：同樣是 postback，會再打回這支 server"""
+    items = []
+    if page > 1:
+        items.append({"type": "action", "action": {"type": "postback", "label": "上一頁",
+                      "data": f"sec={sec}&page={page - 1}", "displayText": "上一頁"}})
+    if page < pages:
+        items.append({"type": "action", "action": {"type": "postback", "label": "下一頁",
+                      "data": f"sec={sec}&page={page + 1}", "displayText": "下一頁"}})
+    return {"items": items} if items else None
+
+def render(sections, sec, page):
+    """回傳 messages list；未知的 section 回傳 None"""
+    spec = sections["sections"].get(sec)
+    if spec is None:
+        return None
+    if "items" not in spec:
+        return [{"type": "text", "text": spec.get("text", spec.get("title", ""))}]
+    size = min(int(sections.get("page_size", 5)), 12)        # carousel 最多 12 個 bubble
+    pages = page_count(spec, size)
+    page = min(page, pages)
+    items = spec["items"][(page - 1) * size: page * size]
+    msg = {"type": "flex", "altText": f"{spec['title']}（{page}/{pages}）",
+           "contents": {"type": "carousel", "contents": [bubble(i) for i in items]}}
+    qr = nav_quick_reply(sec, page, pages)
+    if qr:
+        msg["quickReply"] = qr
+    return [msg]
+
+class Replies:
+    """(section, page) → 已序列化的 messages JSON；啟動時先把所有頁面 render 進 LRU"""
+    def __init__(self, sections, size=CACHE_SIZE):
+        self.sections = sections
+        self.get = lru_cache(maxsize=size)(self._render)
+
+    def _render(self, sec, page):
+        msgs = render(self.sections, sec, page)
+        return json.dumps(msgs, ensure_ascii=False, separators=(",", ":")) if msgs else None
+
+    def warm(self):
+        size = min(int(self.sections.get("page_size", 5)), 12)
+        n = 0
+        for sec, spec in self.sections["sections"].items():
+            for page in range(1, page_count(spec, size) + 1):
+                self.get(sec, page)
+                n += 1
+        return n
+
+    def body(self, reply_token, sec, page):
+        """reply API 的 request body（bytes）；只把 replyToken 拼進預先序列化好的 messages"""
+        msgs = self.get(sec, page)
+        if msgs is None:
+            return None
+        return f'{{"replyToken":{json.dumps(reply_token)},"messages":{msgs}}}'.encode("utf-8")
+
+# ---------- Webhook ----------
+class WebhookApp:
+    def __init__(self, token, secret, replies, path="/callback", workers=None, store=None):
+        self.token, self.secret, self.replies, self.path = token, secret, replies, path
+        self.store, self.compacting = store, False          # store：follow/unfollow 即時寫進本地好友 store
+        self.pool = ThreadPoolExecutor(max_workers=int(workers or os.getenv("REPLY_WORKERS", "64")))
+        self.tasks = set()
+        self.stats = {"events": 0, "replied": 0, "failed": 0, "bad_signature": 0, "follow": 0, "unfollow": 0}
+        self.lock = threading.Lock()
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def post_reply(self, body):
+        # reply API 不支援 retry key；reply token 只能用一次，所以只在 429 重試（line_api 預設行為）
+        r = line_api.post(self.token, "/message/reply", data=body, headers={"Content-Type": "application/json"})
+        if r.ok:
+            self.count("replied")
+        else:
+            self.count("failed")
+            print(f"[ERROR] reply: {r.status_code} {r.text}")
+
+    async def reply(self, body):
+        await asyncio.get_running_loop().run_in_executor(self.pool, self.post_reply, body)
+
+    def update_store(self, kind, uid):
+        """follow / unfollow 追加到 store 的 log；累積夠多筆就在背景 compact，完成後重新載入"""
+        self.count(kind)
+        if self.store is None or not uid:
+            return
+        if getattr(self.store, kind)(uid) and not self.compacting:
+            self.compacting = True
+            loop = asyncio.get_running_loop()
+            fut = loop.run_in_executor(self.pool, FollowerStore(self.store.base).compact)
+            def done(f):
+                self.compacting = False
+                if f.exception():
+                    print(f"[ERROR] follower store compact: {f.exception()}")
+                else:
+                    self.store.open()
+            fut.add_done_callback(done)
+
+    def handle_event(self, ev):
+        self.count("events")
+        if ev.get("type") in ("follow", "unfollow"):
+            return self.update_store(ev["type"], ev.get("source", {}).get("userId"))
+        if ev.get("type") != "postback" or not ev.get("replyToken"):
+            return
+        sec, page = parse_postback(ev.get("postback", {}).get("data"))
+        body = self.replies.body(ev["replyToken"], sec, page)
+        if body is None:
+            print(f"[WARN] 未知的 postback：{ev.get('postback', {}).get('data')!r}")
+            return
+        task = asyncio.get_running_loop().create_task(self.reply(body))
+        self.tasks.add(task)                     # 保留參照，避免 task 被 GC
+        task.add_done_callback(self.tasks.discard)
+
+    def handle(self, method, path, headers, body):
+        """回傳 (status, body)；事件在回 200 之後才在背景送 reply"""
+        if method == "GET" and path == "/healthz":
+            return 200, b"ok"
+        if path != self.path:
+            return 404, b"not found"
+        if method != "POST":
+            return 405, b"method not allowed"
+        if not verify_signature(self.secret, body, headers.get("x-line-signature")):
+            self.count("bad_signature")
+            return 401, b"bad signature"
+        try:
+            events = json.loads(body).get("events", [])
+        except ValueError:
+            return 400, b"bad json"
+        for ev in events:
+            self.handle_event(ev)
+        return 200, b"{}"
+
+async def serve_http(reader, writer, app):
+    """極簡 HTTP/1.1（keep-alive、Content-Length）；LINE 平台只會送 POST + JSON"""
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            method, target, _ = line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                h = await reader.readline()
+                if h in (b"\r\n", b"\n", b""):
+                    break
+                k, _, v = h.decode("latin-1").partition(":")
+                headers[k.strip().lower()] = v.strip()
+            n = int(headers.get("content-length") or 0)
+            if n > MAX_BODY:
+                status, payload, close = 413, b"too large", True
+            else:
+                body = await reader.readexactly(n) if n else b""
+                status, payload = app.handle(method, target.split("?", 1)[0], headers, body)
+                close = headers.get("connection", "").lower() == "close"
+            writer.write(f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                         f"Content-Length: {len(payload)}\r\nContent-Type: application/json\r\n"
+                         f"{'Connection: close' if close else 'Connection: keep-alive'}\r\n\r\n".encode("latin-1")
+                         + payload)
+            await writer.drain()
+            if close:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large"}
+
+async def start_server(app, host="0.0.0.0", port=8000):
+    return await asyncio.start_server(lambda r, w: serve_http(r, w, app), host, port)
+
+def build_app(token, secret, sections_file=SECTIONS_FILE, path="/callback", store_path=None):
+    replies = Replies(load_sections(sections_file))
+    n = replies.warm()
+    print(f"[Webhook] 預先 render {n} 頁回覆（{sections_file}）")
+    store = FollowerStore(store_path).open() if store_path else None
+    if store is not None:
+        print(f"[Webhook] follow/unfollow → {store.base}（目前 {len(store)} 人）")
+    return WebhookApp(token, secret, replies, path, store=store)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    ap.add_argument("--path", default=os.getenv("WEBHOOK_PATH", "/callback"))
+    ap.add_argument("--sections", default=SECTIONS_FILE)
+    ap.add_argument("--follower-store", default=os.getenv("FOLLOWER_STORE"),
+                    help="本地好友 store 路徑前綴（與 daily_push 的 FOLLOWER_STORE 相同）")
+    args = ap.parse_args()
+
+    token, secret = os.getenv("LINE_TOKEN"), os.getenv("CHANNEL_SECRET")
+    if not token or not secret:
+        print("請以環境變數 LINE_TOKEN / CHANNEL_SECRET 提供 Channel access token 與 Channel secret")
+        sys.exit(1)
+
+    app = build_app(token, secret, args.sections, args.path, args.follower_store)
+
+    async def run():
+        server = await start_server(app, args.host, args.port)
+        print(f"[Webhook] listening on http://{args.host}:{args.port}{args.path}")
+        async with server:
+            await server.serve_forever()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
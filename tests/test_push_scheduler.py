@@ -0,0 +1,20 @@
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "richmenu"))
+import push_scheduler
+
+
+def campaign(once, tz="Asia/Taipei"):
+    return push_scheduler.parse_campaign({"name": "c", "tz": tz, "once": once, "text": "hi"})
+
+
+def test_once_keeps_explicit_offset():
+    c = campaign("2025-01-01T09:00+00:00")
+    assert c["once"] == datetime(2025, 1, 1, 9, 0, tzinfo=timezone.utc)
+
+
+def test_once_naive_uses_campaign_tz():
+    c = campaign("2025-01-01T09:00")
+    assert c["once"] == datetime(2025, 1, 1, 1, 0, tzinfo=timezone.utc)